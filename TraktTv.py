@@ -4,10 +4,12 @@
 TraktTvPy
 
 Usage:
-  TraktTv.py search <term> [--add] [options]
-  TraktTv.py watchlist [--delete] [--watch] [--unwatch] [options]
-  TraktTv.py moviesearch <term> [--add] [options]
-  TraktTv.py moviewatchlist [--delete] [--watch] [--unwatch] [options]
+  TraktTv.py search <term> [--add] [--format=<format>] [options]
+  TraktTv.py watchlist [--delete] [--watch] [--unwatch] [--dry-run] [--format=<format>] [options]
+  TraktTv.py moviesearch <term> [--add] [--format=<format>] [options]
+  TraktTv.py moviewatchlist [--delete] [--watch] [--unwatch] [--format=<format>] [options]
+  TraktTv.py daemon [--stop] [options]
+  TraktTv.py sync-all <config>... [--output=<dir>] [options]
 
   TraktTv.py -h | --help
   TraktTv.py --version
@@ -17,23 +19,692 @@ Options:
  -s --skip-watch-info       Skips informing you of watched episodes (HUGE timesaver)
  -l <limit> --limit=<limit> Limit the output
  --todo                     Skips watched episodes in detailed view
+ --dry-run                  Prints the API calls --watch/--unwatch would make instead of making them
+ --format=<format>          Output as text, json or tsv [default: text]
+ -j <jobs> --jobs=<jobs>    Number of parallel requests [default: 4]
+ --rate=<requests>          Maximum requests per second
+ --timeout=<seconds>        Network timeout in seconds [default: 30]
+ --no-cache                 Don't read or store cached responses
+ --refresh                  Ignore cached responses and fetch them again
+ --profile                  Print a summary of API calls and timings at exit
+ --stop                     Stops the running daemon
+ -o <dir> --output=<dir>    Where sync-all writes each account's files [default: trakttvpy-sync]
+
+Commands are forwarded to a running daemon (started from the same directory)
+and run in-process when there is none. The network options given to the daemon
+command apply to every command it serves.
+
+sync-all reads .trakttvpy style configs (or every config in a directory) and
+saves each account's library, watchlists and progress under <dir>/<user>/.
 
 """
 from __future__ import with_statement
 import base64
+import ConfigParser
+import collections
 import datetime
+import errno
 import hashlib
+import httplib
+import itertools
 import json
+import math
 import os
+import Queue
+import random
+import socket
+import SocketServer
+import sqlite3
+import StringIO
 import sys
-import types
+import threading
+import time
+import traceback
 import urllib2
-from docopt import docopt
-from clint.textui import puts, indent, colored
-from clint.textui import progress as progress_bar
+import urlparse
+import zlib
+
+
+def _load_ui():
+    """Imports the console dependencies, library use of TraktTvAPI doesn't need them"""
+    global docopt, puts, colored, progress_bar, SimpleIniFiller
+    from docopt import docopt
+    from clint.textui import colored
+    from clint.textui import puts as clint_puts
+    from clint.textui import progress as progress_bar
+
+    # https://github.com/chesster/SimpleIniFiller
+    from simpleinifiller import SimpleIniFiller
+
+    def puts(s='', newline=True, stream=None):
+        # clint binds sys.stdout at import, the daemon swaps it per command
+        clint_puts(s, newline, stream or sys.stdout.write)
+
+class HttpTransport(object):
+    """
+    Keep-alive connection pool used by TraktTvAPI for every request.
+
+    Connections are kept per (scheme, host) so a client pointed at a local
+    stub server works the same way as one talking to api.trakt.tv. Unless
+    compress is off, gzip and deflate bodies are asked for and decoded.
+    """
+
+    def __init__(self, pool_size=4, timeout=30, compress=True):
+        self.pool_size = pool_size
+        self.timeout   = timeout
+        self.compress  = compress
+        self._pools    = {}
+        self._lock     = threading.Lock()
+
+    def _pool(self, scheme, netloc):
+        with self._lock:
+            if (scheme, netloc) not in self._pools:
+                self._pools[(scheme, netloc)] = Queue.LifoQueue(self.pool_size)
+            return self._pools[(scheme, netloc)]
+
+    def _connect(self, scheme, netloc):
+        if scheme == 'https':
+            return httplib.HTTPSConnection(netloc, timeout=self.timeout)
+        return httplib.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _release(self, pool, conn, response):
+        if response.will_close:
+            conn.close()
+            return
+        try:
+            pool.put_nowait(conn)
+        except Queue.Full:
+            conn.close()
+
+    def _open(self, url, body, headers, idempotent=None):
+        scheme, netloc, path, query, _ = urlparse.urlsplit(url)
+        if query:
+            path = "%s?%s" % (path, query)
+        method = 'GET' if body is None else 'POST'
+        pool = self._pool(scheme, netloc)
+        headers = dict(headers or {})
+        if self.compress:
+            headers.setdefault('Accept-Encoding', 'gzip, deflate')
+
+        # A POST that isn't idempotent is never replayed, the server may have
+        # applied it before the connection broke, so it gets a fresh connection
+        replay = body is None or bool(idempotent)
+        try:
+            conn, reused = (pool.get_nowait(), True) if replay else (self._connect(scheme, netloc), False)
+        except Queue.Empty:
+            conn, reused = self._connect(scheme, netloc), False
+
+        while True:
+            try:
+                conn.request(method, path, body, headers)
+                return pool, conn, conn.getresponse()
+            except (httplib.HTTPException, socket.error), e:
+                conn.close()
+                if reused and not isinstance(e, socket.timeout):
+                    # Server dropped an idle keep-alive connection, retry once on a fresh one
+                    conn, reused = self._connect(scheme, netloc), False
+                    continue
+                raise urllib2.URLError(e)
+
+    def request(self, url, body=None, headers=None, decode=True, idempotent=None):
+        """
+        Sends a GET (or a POST when body is given), returns (status, headers, body).
+        With decode off a compressed body is returned as it came, content-encoding says how.
+        Only GETs and idempotent POSTs are replayed when a kept-alive connection went stale.
+        """
+        pool, conn, response = self._open(url, body, headers, idempotent)
+        try:
+            data = response.read()
+        except (httplib.HTTPException, socket.error), e:
+            conn.close()
+            raise urllib2.URLError(e)
+        self._release(pool, conn, response)
+        response_headers = dict(response.getheaders())
+        if decode and response_headers.get('content-encoding') in CONTENT_ENCODINGS:
+            data = decode_body(data, response_headers.pop('content-encoding'))
+        return response.status, response_headers, data
+
+    def stream(self, url, headers=None, chunk_size=64 * 1024, decode=True):
+        """Sends a GET, returns (status, headers, chunks) where chunks lazily reads (and decodes) the body"""
+        pool, conn, response = self._open(url, None, headers)
+
+        def chunks():
+            done = False
+            try:
+                while True:
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+                done = True
+            except (httplib.HTTPException, socket.error), e:
+                raise urllib2.URLError(e)
+            finally:
+                # A half read response can't be reused
+                if done:
+                    self._release(pool, conn, response)
+                else:
+                    conn.close()
+
+        response_headers = dict(response.getheaders())
+        if decode and response_headers.get('content-encoding') in CONTENT_ENCODINGS:
+            response_headers.pop('content-encoding')
+            return response.status, response_headers, inflate_chunks(chunks(), chunk_size)
+        return response.status, response_headers, chunks()
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools.values(), {}
+        for pool in pools:
+            while not pool.empty():
+                pool.get_nowait().close()
+
+
+class RequestScheduler(object):
+    """
+    Sits between TraktTvAPI and its transport: throttles requests with a token
+    bucket, retries the ones that are safe to retry with exponential backoff
+    and jitter, and lets identical concurrent GETs share one request.
+
+    A 429 was never applied so it is always retried; 5xx responses and
+    connection errors only for GETs and idempotent POSTs.
+    """
+    RETRY_STATUSES = (500, 502, 503, 504)
+
+    def __init__(self, transport, rate=None, burst=10, retries=4, backoff=0.5, max_backoff=30):
+        self.transport   = transport
+        self.rate        = rate
+        self.burst       = burst
+        self.retries     = retries
+        self.backoff     = backoff
+        self.max_backoff = max_backoff
+        self._tokens     = float(burst)
+        self._updated    = time.time()
+        self._bucket     = threading.Lock()
+        self._inflight   = {}
+        self._inflight_lock = threading.Lock()
+
+    def _acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._bucket:
+                now = time.time()
+                self._tokens  = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if 1 <= self._tokens:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def _delay(self, attempt, retry_after=None):
+        try:
+            return min(self.max_backoff, float(retry_after))
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _retry(self, attempt, status, idempotent):
+        if self.retries <= attempt:
+            return False
+        return status == 429 or (idempotent and status in self.RETRY_STATUSES)
+
+    def request(self, url, body=None, headers=None, idempotent=None, decode=True):
+        """Same as HttpTransport.request, GETs are always treated as idempotent"""
+        if body is not None:
+            return self._send(url, body, headers, bool(idempotent), decode)
+        key = (url, (headers or {}).get('Authorization'), decode)
+        return self._shared(key, lambda: self._send(url, None, headers, True, decode))
+
+    def _send(self, url, body, headers, idempotent, decode=True):
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                status, response_headers, data = self.transport.request(url, body, headers, decode, idempotent)
+            except urllib2.URLError:
+                # A POST may have been applied before the connection broke
+                if not idempotent or self.retries <= attempt:
+                    raise
+                retry_after = None
+            else:
+                if not self._retry(attempt, status, idempotent):
+                    return status, response_headers, data
+                retry_after = response_headers.get('retry-after')
+            time.sleep(self._delay(attempt, retry_after))
+            attempt += 1
+
+    def _shared(self, key, call):
+        with self._inflight_lock:
+            entry = self._inflight.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._inflight[key] = [threading.Event(), None]
+
+        if not owner:
+            entry[0].wait()
+            ok, result = entry[1]
+            if not ok:
+                raise result[0], result[1], result[2]
+            return result
+
+        try:
+            entry[1] = (True, call())
+        except BaseException:
+            entry[1] = (False, sys.exc_info())
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            entry[0].set()
+        return entry[1][1]
+
+    def stream(self, url, headers=None, chunk_size=64 * 1024, decode=True):
+        """Same as HttpTransport.stream, retried until the body starts arriving"""
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                status, response_headers, chunks = self.transport.stream(url, headers, chunk_size, decode)
+            except urllib2.URLError:
+                if self.retries <= attempt:
+                    raise
+                retry_after = None
+            else:
+                if not self._retry(attempt, status, True):
+                    return status, response_headers, chunks
+                for chunk in chunks:
+                    pass
+                retry_after = response_headers.get('retry-after')
+            time.sleep(self._delay(attempt, retry_after))
+            attempt += 1
+
+
+# Content-Encodings HttpTransport asks for, both decode with zlib's header detection
+CONTENT_ENCODINGS = ('gzip', 'deflate')
+
+
+def decode_body(data, encoding):
+    """Undoes a gzip or deflate Content-Encoding"""
+    if encoding not in CONTENT_ENCODINGS:
+        return data
+    try:
+        return zlib.decompress(data, 32 + zlib.MAX_WBITS)
+    except zlib.error, e:
+        raise urllib2.URLError(e)
+
+
+def inflate_chunks(chunks, chunk_size=64 * 1024):
+    """Decompresses zlib or gzip chunks as they come, yielding at most chunk_size bytes at a time"""
+    decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            while chunk:
+                data = decompressor.decompress(chunk, chunk_size)
+                chunk = decompressor.unconsumed_tail
+                if data:
+                    yield data
+        data = decompressor.flush()
+    except zlib.error, e:
+        raise urllib2.URLError(e)
+    if data:
+        yield data
+
+
+def iter_json_array(chunks):
+    """
+    Decodes a JSON document arriving as string chunks, yielding the items of
+    a top level array one at a time. Any other document is yielded whole.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, started, ended = '', 0, False, False
+    chunks = iter(chunks)
+
+    while True:
+        chunk = next(chunks, None)
+        if chunk is None:
+            ended = True
+        else:
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        if not started:
+            stripped = buf.lstrip()
+            if not stripped and not ended:
+                continue
+            if not stripped.startswith('['):
+                if ended:
+                    yield json.loads(buf)
+                    return
+                continue
+            buf, pos, started = stripped, 1, True
+
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buf):
+                break
+            if buf[pos] == ']':
+                # Drain the rest so the connection goes back to the pool
+                for chunk in chunks:
+                    pass
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if ended:
+                    raise
+                break
+            if not ended and (end == len(buf) or (isinstance(item, (int, long, float)) and buf[end] in '0123456789.eE+-')):
+                # A number may continue in the next chunk, "-15." decodes as -15 up to the dot
+                break
+            pos = end
+            yield item
+
+        if ended:
+            raise ValueError("Unterminated JSON array")
+
+
+class HotEntries(object):
+    """
+    In-memory LRU of decompressed entries kept in front of the SQLite stores.
+
+    A size of 0 keeps nothing, which is what a single command run wants; the
+    daemon keeps its hot set here so cached views skip SQLite and zlib.
+    """
+
+    def __init__(self, size=0):
+        self.size = size
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        value = self._entries.pop(key, None)
+        if value is not None:
+            self._entries[key] = value
+        return value
+
+    def set(self, key, value):
+        if not self.size:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while self.size < len(self._entries):
+            self._entries.popitem(last=False)
+
+    def discard(self, prefix=''):
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+
+class ResponseCache(object):
+    """
+    SQLite store for raw GET responses, zlib compressed.
+
+    Every entry carries its own expiry time; once the stored payloads grow
+    past max_size bytes the least recently used entries are evicted. The
+    last memory entries read or written are also kept decompressed in memory.
+    """
+
+    def __init__(self, filename='.trakttvpy.cache', max_size=32 * 1024 * 1024, memory=0):
+        self.max_size = max_size
+        self._hot  = HotEntries(memory)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('PRAGMA synchronous = OFF')
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL, accessed REAL, size INTEGER, data BLOB)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._db.commit()
+
+    def get(self, key, stream=False):
+        """Returns the response for key or None, as decompressed chunks when stream is set"""
+        now = time.time()
+        with self._lock:
+            hot = self._hot.get(key)
+            if hot is not None and now <= hot[0]:
+                return iter([hot[1]]) if stream else hot[1]
+            row = self._db.execute('SELECT expires, data FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] < now:
+                self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._db.commit()
+                return None
+            self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self._db.commit()
+            if stream:
+                return inflate_chunks([str(row[1])])
+            data = zlib.decompress(str(row[1]), 32 + zlib.MAX_WBITS)
+            self._hot.set(key, (row[0], data))
+        return data
+
+    def set(self, key, ttl, data, compressed=False):
+        now  = time.time()
+        blob = data if compressed else zlib.compress(data)
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)', (key, now + ttl, now, len(blob), sqlite3.Binary(blob)))
+            self._evict()
+            self._db.commit()
+            if compressed:
+                self._hot.discard(key)
+            else:
+                self._hot.set(key, (now + ttl, data))
+
+    def _evict(self):
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_size:
+            return
+        stale = []
+        for key, size in self._db.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            if total <= self.max_size:
+                break
+            stale.append((key,))
+            total -= size
+        self._db.executemany('DELETE FROM responses WHERE key = ?', stale)
+        for key, in stale:
+            self._hot.discard(key)
+
+    def invalidate(self, prefix):
+        """Drops every entry whose key starts with prefix"""
+        with self._lock:
+            self._db.execute('DELETE FROM responses WHERE substr(key, 1, ?) = ?', (len(prefix), prefix))
+            self._db.commit()
+            self._hot.discard(prefix)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+            self._db.commit()
+            self._hot.discard()
+
+
+class LibraryMirror(object):
+    """
+    Local copy of a user's library, watchlist and progress responses.
+
+    Each entry is stored with the user/lastactivity timestamps it was fetched
+    under, so it only has to be refetched once one of them moves. Entries
+    older than max_age are dropped, and once the stored payloads grow past
+    max_size bytes the oldest fetched ones are evicted. Like ResponseCache,
+    the last memory entries are kept decompressed in memory.
+    """
+
+    # Newly aired episodes change progress without any user activity, so mirrored entries still expire
+    MAX_AGE = 6 * 3600
+
+    def __init__(self, filename='.trakttvpy.cache', max_size=32 * 1024 * 1024, max_age=MAX_AGE, memory=0):
+        self.max_size = max_size
+        self.max_age  = max_age
+        self._hot  = HotEntries(memory)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('PRAGMA synchronous = OFF')
+        self._db.execute('CREATE TABLE IF NOT EXISTS library (key TEXT PRIMARY KEY, stamp TEXT, fetched REAL, data BLOB)')
+        self._db.commit()
+
+    def get(self, key, stream=False):
+        """Returns (stamp, fetched, data) for key or None, data as decompressed chunks when stream is set"""
+        oldest = time.time() - self.max_age
+        with self._lock:
+            entry = self._hot.get(key)
+            if entry is not None and oldest <= entry[1]:
+                return entry[:2] + (iter([entry[2]]),) if stream else entry
+            row = self._db.execute('SELECT stamp, fetched, data FROM library WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < oldest:
+                self._db.execute('DELETE FROM library WHERE key = ?', (key,))
+                self._db.commit()
+                self._hot.discard(key)
+                return None
+            if stream:
+                return row[0], row[1], inflate_chunks([str(row[2])])
+            entry = row[0], row[1], zlib.decompress(str(row[2]), 32 + zlib.MAX_WBITS)
+            self._hot.set(key, entry)
+        return entry
+
+    def set(self, key, stamp, data, compressed=False):
+        now  = time.time()
+        blob = data if compressed else zlib.compress(data)
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO library VALUES (?, ?, ?, ?)', (key, stamp, now, sqlite3.Binary(blob)))
+            self._evict(now)
+            self._db.commit()
+            if compressed:
+                self._hot.discard(key)
+            else:
+                self._hot.set(key, (stamp, now, data))
+
+    def _evict(self, now):
+        # Progress is keyed by its chunk of show ids, so every other chunking leaves rows behind
+        self._db.execute('DELETE FROM library WHERE fetched < ?', (now - self.max_age,))
+        total = self._db.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM library').fetchone()[0]
+        if total <= self.max_size:
+            return
+        stale = []
+        for key, size in self._db.execute('SELECT key, LENGTH(data) FROM library ORDER BY fetched'):
+            if total <= self.max_size:
+                break
+            stale.append((key,))
+            total -= size
+        self._db.executemany('DELETE FROM library WHERE key = ?', stale)
+        for key, in stale:
+            self._hot.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM library')
+            self._db.commit()
+            self._hot.discard()
+
+
+class Model(object):
+    """
+    Base for the slotted records built from API results. Only the fields a
+    model declares are kept, the rest of the decoded JSON can be freed as
+    soon as the record is built. Item access (show['title'], movie.get('year'))
+    still works for code written against the plain dicts.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, name):
+        if name != 'id' and name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_json() == other.to_json()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.to_json())
+
+    def to_json(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    @staticmethod
+    def encode(obj):
+        """json.dumps default, so models can go into POST bodies as they are"""
+        if isinstance(obj, Model):
+            return obj.to_json()
+        raise TypeError("%r is not JSON serializable" % (obj,))
+
+
+class Show(Model):
+    __slots__ = ('title', 'year', 'tvdb_id', 'tmdb_id', 'imdb_id')
+
+    def __init__(self, data):
+        self.title   = data.get('title', '')
+        self.year    = data.get('year', '')
+        self.tvdb_id = data.get('tvdb_id', '')
+        self.tmdb_id = data.get('tmdb_id', '')
+        self.imdb_id = data.get('imdb_id', '')
+
+    @property
+    def id(self):
+        return self.tvdb_id
+
+
+class Movie(Model):
+    __slots__ = ('title', 'year', 'tmdb_id', 'imdb_id')
+
+    def __init__(self, data):
+        self.title   = data.get('title', '')
+        self.year    = data.get('year', '')
+        self.tmdb_id = data.get('tmdb_id', '')
+        self.imdb_id = data.get('imdb_id', '')
+
+    @property
+    def id(self):
+        return self.tmdb_id
+
+    @property
+    def label(self):
+        return "%s (%s)" % (self.title or self.tmdb_id, self.year)
+
+
+class Season(Model):
+    """A season of show/seasons (an episode count) or of a summary or progress (the episodes)"""
+    __slots__ = ('season', 'episodes')
+
+    def __init__(self, data):
+        self.season   = int(data['season'])
+        self.episodes = data['episodes']
+
+    @property
+    def id(self):
+        return self.season
+
+    @property
+    def count(self):
+        if isinstance(self.episodes, (list, dict)):
+            return len(self.episodes)
+        return int(self.episodes)
+
+
+class Progress(Model):
+    """One show of user/progress/watched"""
+    __slots__ = ('show', 'left', 'seasons')
+
+    def __init__(self, data):
+        self.show    = Show(data['show'])
+        self.left    = int(data['progress']['left'])
+        self.seasons = [Season(s) for s in data.get('seasons', ())]
+
+    @property
+    def id(self):
+        return self.show.tvdb_id
 
-# https://github.com/chesster/SimpleIniFiller
-from simpleinifiller import SimpleIniFiller
 
 class TraktTvAPI(object):
 
@@ -49,89 +720,1110 @@ class TraktTvAPI(object):
         return decorator
 
 
-    def __init__(self, arg, user, pwd):
+    # POST_METHODS that can be repeated without changing the outcome, safe to retry after a failure
+    IDEMPOTENT_POST_METHODS = {
+        'account/settings', 'account/test',
+        'movie/cancelcheckin', 'movie/cancelwatching', 'movie/library', 'movie/seen', 'movie/unlibrary', 'movie/unseen', 'movie/unwatchlist', 'movie/watchlist',
+        'network/follow', 'network/unfollow',
+        'rate/episode', 'rate/episodes', 'rate/movie', 'rate/movies', 'rate/show', 'rate/shows',
+        'recommendations/movies/dismiss', 'recommendations/shows/dismiss',
+        'show/cancelcheckin', 'show/cancelwatching', 'show/episode/library', 'show/episode/seen', 'show/episode/unlibrary', 'show/episode/unseen',
+        'show/episode/unwatchlist', 'show/episode/watchlist', 'show/library', 'show/season/library', 'show/season/seen', 'show/seen',
+        'show/unlibrary', 'show/unwatchlist', 'show/watchlist',
+    }
+
+    # Shows per user/progress/watched request
+    PROGRESS_CHUNK = 25
+
+    # Seconds a GET_METHODS response stays in the cache, paths not listed are never cached
+    CACHE_TTL = {
+        'genres/movies': 7 * 86400, 'genres/shows': 7 * 86400,
+        'movie/related': 86400, 'movie/summaries': 86400, 'movie/summary': 86400,
+        'show/episode/summary': 86400, 'show/related': 86400, 'show/season': 86400, 'show/seasons': 86400, 'show/summaries': 86400, 'show/summary': 86400,
+        'search/episodes': 3600, 'search/movies': 3600, 'search/people': 3600, 'search/shows': 3600, 'search/users': 3600,
+        'user/library/movies/all': 600, 'user/library/movies/watched': 600, 'user/library/shows/all': 600, 'user/library/shows/watched': 600,
+        'user/progress/collected': 600, 'user/progress/watched': 600,
+        'user/watchlist/episodes': 600, 'user/watchlist/movies': 600, 'user/watchlist/shows': 600,
+    }
+
+    # GET_METHODS kept in the LibraryMirror, keyed by the user/lastactivity timestamps they depend on
+    MIRROR_SECTIONS = {
+        'user/library/movies/all':     (('movie', 'watched'), ('movie', 'scrobble'), ('movie', 'seen'), ('movie', 'checkin'), ('movie', 'collection')),
+        'user/library/movies/watched': (('movie', 'watched'), ('movie', 'scrobble'), ('movie', 'seen'), ('movie', 'checkin')),
+        'user/library/shows/all':      (('episode', 'watched'), ('episode', 'scrobble'), ('episode', 'seen'), ('episode', 'checkin'), ('episode', 'collection')),
+        'user/library/shows/watched':  (('episode', 'watched'), ('episode', 'scrobble'), ('episode', 'seen'), ('episode', 'checkin')),
+        'user/progress/watched':       (('episode', 'watched'), ('episode', 'scrobble'), ('episode', 'seen'), ('episode', 'checkin')),
+        'user/watchlist/episodes':     (('episode', 'watchlist'),),
+        'user/watchlist/movies':       (('movie', 'watchlist'),),
+        'user/watchlist/shows':        (('show', 'watchlist'),),
+    }
+    LASTACTIVITY_TTL = 60
+
+    API_URL = 'https://api.trakt.tv'
+
+    _endpoint_names = None
+
+    def __init__(self, arg, user, pwd, transport=None, api_url=None, cache=None, refresh=False, mirror=None, scheduler=None):
 
         self.api  = arg
         self.user = user
         self.pwd  = pwd
+        self.transport = transport or HttpTransport()
+        self.scheduler = scheduler or RequestScheduler(self.transport)
+        self.api_url   = (api_url or self.API_URL).rstrip('/')
+        self.cache     = cache
+        self.refresh   = refresh
+        self.mirror    = mirror
+        self._activity = None
+        self._activity_lock = threading.Lock()
+
+        # pre hooks get (path, method), post hooks a dict with path, method, status,
+        # latency, size, cache ('hit', 'miss' or None), start and end
+        self.pre_request_hooks  = []
+        self.post_request_hooks = []
+
+    def __getattr__(self, name):
+        # get_*/iter_*/post_* endpoint methods are generated on first use and kept on the class
+        method = TraktTvAPI._endpoint_method(name)
+        if method is None:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+        setattr(type(self), name, method)
+        return getattr(self, name)
 
-        def __post(args, post_data=None):
-            path = ("https://api.trakt.tv/%s/%s/%s" % (args[0] + ('' if post_data else '.json'), self.api, "/".join([str(a) for a in args[1:]]))).rstrip('/')
-
-            request = urllib2.Request(path)
-            if post_data:
-                post_data.update({"username": self.user, "password": hashlib.sha1(self.pwd).hexdigest(),})
-                request.add_header('Content-Type', 'application/json')
-            else:
-                request.add_header("Authorization", "Basic %s" % base64.encodestring("%s:%s\n" % (self.user, self.pwd)))
-            return json.load(urllib2.urlopen(request)) if not post_data else json.load(urllib2.urlopen(request, json.dumps(post_data)))
+    @staticmethod
+    def _endpoint_method(name):
+        endpoint = TraktTvAPI._endpoints().get(name)
+        if endpoint is None:
+            return None
+        path, kind = endpoint
 
-        for path in self.GET_METHODS:
-            method_name = path.replace('/','_')
+        if kind == 'post':
             @TraktTvAPI.get_api(path)
             def method(target, *args, **kwargs):
-                return __post(args)
-            setattr(self, "get_%s" % method_name, types.MethodType(method, self))
-
-        for path in self.POST_METHODS:
-            method_name = path.replace('/','_')
+                return target._request(args, kwargs)
+        elif kind == 'iter':
+            @TraktTvAPI.get_api(path)
+            def method(target, *args, **kwargs):
+                return target._iter_request(args)
+        else:
             @TraktTvAPI.get_api(path)
             def method(target, *args, **kwargs):
-                return __post(args, kwargs)
-            setattr(self, "post_%s" % method_name, types.MethodType(method, self))
+                return target._request(args)
+        method.__name__ = name
+        return method
+
+    @classmethod
+    def _endpoints(cls):
+        if cls._endpoint_names is None:
+            names = {}
+            for path in cls.GET_METHODS:
+                names["get_%s" % path.replace('/','_')] = (path, 'get')
+                names["iter_%s" % path.replace('/','_')] = (path, 'iter')
+            for path in cls.POST_METHODS:
+                names["post_%s" % path.replace('/','_')] = (path, 'post')
+            TraktTvAPI._endpoint_names = names
+        return cls._endpoint_names
+
+    def _url(self, args, post=False):
+        return ("%s/%s/%s/%s" % (self.api_url, args[0] + ('' if post else '.json'), self.api, "/".join([str(a) for a in args[1:]]))).rstrip('/')
+
+    def _auth_headers(self):
+        return {"Authorization": "Basic %s" % base64.b64encode("%s:%s" % (self.user, self.pwd))}
+
+    def _request(self, args, post_data=None):
+        if not post_data:
+            info = self._before(args[0], 'GET')
+            path = self._url(args)
+            data, store = self._stored(args[0], "%s|%s|%s" % (self.user, args[0], path))
+            if data is not None:
+                self._after(info, 200, len(data), 'hit')
+                return json.loads(data)
+            info['cache'] = store and 'miss'
+            return json.loads(self._fetch(path, None, self._auth_headers(), info, store=store))
+
+        info = self._before(args[0], 'POST')
+        path = self._url(args, True)
+        post_data.update({"username": self.user, "password": hashlib.sha1(self.pwd).hexdigest(),})
+        data = self._fetch(path, json.dumps(post_data, default=Model.encode), {'Content-Type': 'application/json'}, info, args[0] in self.IDEMPOTENT_POST_METHODS)
+
+        # Any mutation may change what the user/* endpoints return
+        self._activity = None
+        if self.cache:
+            self.cache.invalidate("%s|user/" % self.user)
+        return json.loads(data)
+
+    def _iter_request(self, args):
+        info = self._before(args[0], 'GET')
+        path = self._url(args)
+        chunks, store = self._stored(args[0], "%s|%s|%s" % (self.user, args[0], path), stream=True)
+        if chunks is not None:
+            info['cache'] = 'hit'
+            return iter_json_array(self._counting(chunks, info, 200))
+        info['cache'] = store and 'miss'
+
+        try:
+            status, response_headers, chunks = self.scheduler.stream(path, self._auth_headers(), decode=False)
+        except urllib2.URLError:
+            self._after(info)
+            raise
+        encoding = response_headers.get('content-encoding')
+        if 400 <= status:
+            data = ''.join(chunks)
+            self._after(info, status, len(data))
+            raise urllib2.HTTPError(path, status, httplib.responses.get(status, ''), response_headers, StringIO.StringIO(decode_body(data, encoding)))
+
+        # Sizes are counted as they come over the wire, a compressed body is stored as is
+        chunks = self._counting(chunks, info, status)
+        if encoding in CONTENT_ENCODINGS:
+            if store:
+                chunks = TraktTvAPI._storing(chunks, store)
+            chunks = inflate_chunks(chunks)
+        elif store:
+            chunks = TraktTvAPI._compressing(chunks, store)
+        return iter_json_array(chunks)
 
     @staticmethod
-    def _display_show(shows, key='tvdb_id'):
-        return  [{
-            'title': s['title'], 
-            'year': s['year'], 
-            'tvdb_id': s.get('tvdb_id', ''),
-            'tmdb_id': s.get('tmdb_id', ''),
-            'imdb_id': s.get('imdb_id', ''),
-            'id' : s[key]
-        } for s in shows]
+    def _storing(chunks, store):
+        """Passes compressed chunks through, storing them once the whole body has been read"""
+        blob = []
+        for chunk in chunks:
+            blob.append(chunk)
+            yield chunk
+        store(''.join(blob), True)
+
+    @staticmethod
+    def _compressing(chunks, store):
+        """Passes chunks through, storing them compressed once the whole body has been read"""
+        compressor = zlib.compressobj()
+        blob = []
+        for chunk in chunks:
+            blob.append(compressor.compress(chunk))
+            yield chunk
+        blob.append(compressor.flush())
+        store(''.join(blob), True)
+
+    def _counting(self, chunks, info, status):
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._after(info, status, size)
+
+    def _fetch(self, path, body, headers, info, idempotent=True, store=None):
+        """Returns the decoded body, store gets a compressed body as it came over the wire"""
+        try:
+            status, response_headers, blob = self.scheduler.request(path, body, headers, idempotent, decode=False)
+        except urllib2.URLError:
+            self._after(info)
+            raise
+        self._after(info, status, len(blob))
+        encoding = response_headers.get('content-encoding')
+        data = decode_body(blob, encoding)
+        if 400 <= status:
+            raise urllib2.HTTPError(path, status, httplib.responses.get(status, ''), response_headers, StringIO.StringIO(data))
+        if store:
+            if encoding in CONTENT_ENCODINGS:
+                store(blob, True)
+            else:
+                store(data)
+        return data
+
+    ##
+    # INSTRUMENTATION
+    ##
+    def _before(self, path, method):
+        for hook in self.pre_request_hooks:
+            hook(path, method)
+        return {'path': path, 'method': method, 'status': None, 'size': 0, 'cache': None, 'start': time.time()}
+
+    def _after(self, info, status=None, size=0, cache=None):
+        """Fills in the outcome of a request and hands it to the post request hooks"""
+        info['end'] = time.time()
+        info.update(status=status, size=size, latency=info['end'] - info['start'])
+        if cache:
+            info['cache'] = cache
+        for hook in self.post_request_hooks:
+            hook(info)
+
+    def _stored(self, section, key, stream=False):
+        """
+        Returns the stored response for key (or None) and a callable storing a
+        fresh one (or None). With stream set the response comes as decompressed chunks.
+        """
+        if self.mirror and section in self.MIRROR_SECTIONS:
+            stamp = json.dumps([self._last_activity().get(group, {}).get(name) for group, name in self.MIRROR_SECTIONS[section]])
+            entry = None if self.refresh else self.mirror.get(key, stream)
+            if entry and entry[0] == stamp:
+                return entry[2], None
+            return None, lambda data, compressed=False: self.mirror.set(key, stamp, data, compressed)
+
+        ttl = self.cache and self.CACHE_TTL.get(section)
+        if not ttl:
+            return None, None
+        data = None if self.refresh else self.cache.get(key, stream)
+        if data is not None:
+            return data, None
+        return None, lambda data, compressed=False: self.cache.set(key, ttl, data, compressed)
+
+    def _last_activity(self):
+        with self._activity_lock:
+            if self._activity is None or self.LASTACTIVITY_TTL < time.time() - self._activity[0]:
+                self._activity = (time.time(), self.get_user_lastactivity(self.user))
+            return self._activity[1]
+
+    @staticmethod
+    def imap(func, items, jobs=4):
+        """Calls func for every item using up to jobs threads, yields the results in order"""
+        items = list(items)
+        if jobs <= 1 or len(items) <= 1:
+            for item in items:
+                yield func(item)
+            return
+
+        pending = Queue.Queue()
+        for i in range(len(items)):
+            pending.put(i)
+        results = [None] * len(items)
+        done = [threading.Event() for _ in items]
+
+        def worker():
+            while True:
+                try:
+                    i = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    results[i] = (True, func(items[i]))
+                except BaseException:
+                    results[i] = (False, sys.exc_info())
+                done[i].set()
+
+        for _ in range(min(jobs, len(items))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+        try:
+            for i in range(len(items)):
+                done[i].wait()
+                ok, result = results[i]
+                results[i] = None
+                if not ok:
+                    raise result[0], result[1], result[2]
+                yield result
+        finally:
+            # Stop handing out work once the caller is gone
+            while not pending.empty():
+                try:
+                    pending.get_nowait()
+                except Queue.Empty:
+                    break
+
+    @staticmethod
+    def _movie_label(movie):
+        if isinstance(movie, Movie):
+            return movie.label
+        return Movie(movie).label
 
     ##
     # API METHODS:
     ##
     def search_movies(self, query, limit=10):
-        return TraktTvAPI._display_show(self.get_search_movies(query, limit), 'tmdb_id')
+        return [Movie(m) for m in self.iter_search_movies(query, limit)]
 
     def search(self, query, limit=10):
-        return TraktTvAPI._display_show(self.get_search_shows(query, limit))
+        return [Show(s) for s in self.iter_search_shows(query, limit)]
 
     def my_shows(self):
-        return TraktTvAPI._display_show(self.get_user_watchlist_shows(self.user))
+        return [Show(s) for s in self.iter_user_watchlist_shows(self.user)]
 
     def my_movies(self):
-        return TraktTvAPI._display_show(self.get_user_watchlist_movies(self.user), 'tmdb_id')
+        return [Movie(m) for m in self.iter_user_watchlist_movies(self.user)]
 
     def watched(self):
-        return tv.get_user_library_shows_watched(self.user)
+        return self.get_user_library_shows_watched(self.user)
 
     def watched_movies(self):
-        return tv.get_user_library_movies_watched(self.user)
+        return self.get_user_library_movies_watched(self.user)
+
+    def progress_watched(self, *show_ids):
+        return self.get_user_progress_watched(self.user, ",".join([str(s) for s in show_ids]))
+
+    def iter_progress_watched(self, *show_ids):
+        return itertools.imap(Progress, self.iter_user_progress_watched(self.user, ",".join([str(s) for s in show_ids])))
+
+    def iter_watched(self):
+        return self.iter_user_library_shows_watched(self.user)
+
+    def iter_watched_movies(self):
+        return self.iter_user_library_movies_watched(self.user)
+
+
+class AsyncTraktTvAPI(object):
+    """
+    Non-blocking twin of TraktTvAPI. Every get_*/post_* endpoint and helper
+    returns an AsyncResult right away while the call runs on a pool of worker
+    threads sharing one keep-alive connection pool; gather() collects them.
+    A callback= keyword is called from the worker thread once the call is
+    done, so an event loop can be woken up instead of waiting on get().
+    """
+
+    HELPERS = ('search', 'search_movies', 'my_shows', 'my_movies', 'watched', 'watched_movies', 'progress_watched')
+
+    def __init__(self, arg, user, pwd, workers=8, **kwargs):
+        kwargs.setdefault('transport', HttpTransport(pool_size=workers))
+        self.sync    = TraktTvAPI(arg, user, pwd, **kwargs)
+        self.workers = workers
+        self._pool   = None
+        self._lock   = threading.Lock()
+
+    def __getattr__(self, name):
+        endpoint = TraktTvAPI._endpoints().get(name)
+        if name in self.HELPERS or (endpoint and endpoint[1] != 'iter'):
+            func = getattr(self.sync, name)
+            def method(*args, **kwargs):
+                return self.submit(func, *args, **kwargs)
+            method.__name__ = name
+            self.__dict__[name] = method
+            return method
+        if name.startswith('_'):
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+        return getattr(self.sync, name)
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                from multiprocessing.pool import ThreadPool
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) on the worker pool, returns its AsyncResult.
+        A callback keyword is called with (value, None) or (None, exception).
+        """
+        callback = kwargs.pop('callback', None)
+        if callback is None:
+            return self.pool.apply_async(func, args, kwargs)
+        def call():
+            try:
+                value = func(*args, **kwargs)
+            except Exception, e:
+                callback(None, e)
+                raise
+            callback(value, None)
+            return value
+        return self.pool.apply_async(call)
+
+    @staticmethod
+    def gather(*results, **kwargs):
+        """Waits for every AsyncResult, returns their values in order"""
+        return [r.get(kwargs.get('timeout')) for r in results]
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+        self.sync.transport.close()
+
+
+class SummaryBatcher(object):
+    """
+    Collects per id lookups and resolves them through the multi id
+    show/summaries or movie/summaries endpoints: at most chunk_size ids and
+    max_length characters of ids per request, results handed back per id.
+    """
+
+    # Keys an id is matched against, in order: a number is a tvdb (or tmdb)
+    # id first, so it never picks up another title's tvrage id
+    ID_KEYS = {
+        'show':  ('tvdb_id', 'imdb_id', 'tvrage_id'),
+        'movie': ('tmdb_id', 'imdb_id'),
+    }
+
+    def __init__(self, api, kind='show', extended=None, chunk_size=50, max_length=1000, jobs=1):
+        self.api        = api
+        self.kind       = kind
+        self.extended   = extended
+        self.chunk_size = chunk_size
+        self.max_length = max_length
+        self.jobs       = jobs
+        self.pending    = []
+        self.results    = {}
+
+    def add(self, *ids):
+        for i in [str(i) for i in ids]:
+            if i not in self.results and i not in self.pending:
+                self.pending.append(i)
+
+    def chunks(self):
+        chunk, length = [], 0
+        for i in self.pending:
+            if chunk and (self.chunk_size <= len(chunk) or self.max_length < length + len(i) + 1):
+                yield chunk
+                chunk, length = [], 0
+            chunk.append(i)
+            length += len(i) + 1
+        if chunk:
+            yield chunk
+
+    def _fetch(self, chunk):
+        method = getattr(self.api, "get_%s_summaries" % self.kind)
+        return method(",".join(chunk), *([self.extended] if self.extended else []))
+
+    def flush(self):
+        chunks, self.pending = list(self.chunks()), []
+        keys = self.ID_KEYS[self.kind]
+        for chunk, summaries in zip(chunks, self.api.imap(self._fetch, chunks, self.jobs)):
+            found = dict((key, {}) for key in keys)
+            for summary in summaries if isinstance(summaries, list) else []:
+                for key in keys:
+                    if summary.get(key):
+                        found[key].setdefault(str(summary[key]), summary)
+            for i in chunk:
+                self.results[i] = next((found[key][i] for key in keys if i in found[key]), None)
+
+    def get(self, id):
+        """Summary for id (None if the API didn't return one), flushing pending lookups if needed"""
+        if str(id) not in self.results:
+            self.add(id)
+            self.flush()
+        return self.results[str(id)]
+
+
+class RequestProfiler(object):
+    """
+    Post request hook collecting every request of a TraktTvAPI into a per
+    endpoint summary of calls, cache hits, latency and bytes.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.apis     = []
+        self._lock = threading.Lock()
+
+    def attach(self, api):
+        api.post_request_hooks.append(self)
+        self.apis.append(api)
+        return self
+
+    def detach(self):
+        for api in self.apis:
+            api.post_request_hooks.remove(self)
+        self.apis = []
+
+    def __call__(self, info):
+        with self._lock:
+            self.requests.append(dict(info))
+
+    @staticmethod
+    def _percentile(values, p):
+        values = sorted(values)
+        return values[max(0, int(math.ceil(p * len(values))) - 1)]
+
+    def fetch_time(self):
+        """Wall time during which at least one request was in flight"""
+        total, until = 0.0, None
+        for start, end in sorted((r['start'], r['end']) for r in self.requests if r['cache'] != 'hit'):
+            if until is None or until < start:
+                total += end - start
+                until = end
+            elif until < end:
+                total += end - until
+                until = end
+        return total
+
+    def report(self, wall):
+        """Returns the summary table as a list of lines"""
+        endpoints = {}
+        for r in self.requests:
+            endpoints.setdefault((r['method'], r['path']), []).append(r)
+
+        lines = ["%-36s %6s %6s %9s %9s %10s" % ('endpoint', 'calls', 'hits', 'p50 (ms)', 'p95 (ms)', 'bytes')]
+        for (method, path), requests in sorted(endpoints.items(), key=lambda e: -sum(r['latency'] for r in e[1])):
+            latencies = [r['latency'] * 1000 for r in requests]
+            lines.append("%-36s %6d %6d %9.1f %9.1f %10d" % (
+                "%s %s" % (method, path),
+                len(requests),
+                len([r for r in requests if r['cache'] == 'hit']),
+                RequestProfiler._percentile(latencies, 0.5),
+                RequestProfiler._percentile(latencies, 0.95),
+                sum(r['size'] for r in requests),
+            ))
+        fetching = min(wall, self.fetch_time())
+        lines.append("%d requests, %d bytes" % (len(self.requests), sum(r['size'] for r in self.requests)))
+        lines.append("total %.3fs: fetching %.3fs, rendering and other %.3fs" % (wall, fetching, wall - fetching))
+        return lines
+
+
+class SeasonState(object):
+    """
+    Watch state of one season packed into two bitsets, bit n standing for
+    episode n: the episodes that exist and the ones that were watched.
+    """
+    __slots__ = ('known', 'seen')
+
+    def __init__(self, episodes=0):
+        self.known = (1 << (episodes + 1)) - 2 if episodes else 0
+        self.seen  = 0
+
+    def set(self, episode, watched):
+        bit = 1 << episode
+        self.known |= bit
+        if watched:
+            self.seen |= bit
+        else:
+            self.seen &= ~bit
+
+    def __len__(self):
+        return bin(self.known).count('1')
+
+    def __iter__(self):
+        """Yields (episode, watched) in episode order"""
+        return SeasonState._bits(self.known, self.seen)
+
+    def unwatched(self):
+        """Yields (episode, False) for every unwatched episode in order"""
+        return SeasonState._bits(self.known & ~self.seen, 0)
+
+    def unwatched_count(self):
+        return bin(self.known & ~self.seen).count('1')
+
+    def next_unwatched(self):
+        left = self.known & ~self.seen
+        return (left & -left).bit_length() - 1 if left else None
+
+    def update(self, episodes):
+        """Sets the state of many episodes from an {episode: watched} mapping"""
+        known, seen = self.known, self.seen
+        for episode, watched in episodes.items():
+            bit = 1 << int(episode)
+            known |= bit
+            seen = seen | bit if watched else seen & ~bit
+        self.known, self.seen = known, seen
+
+    @staticmethod
+    def _bits(known, seen):
+        # bin() walks the bits in C, far cheaper than shifting in Python
+        known = bin(known)[:1:-1]
+        seen  = bin(seen)[:1:-1].ljust(len(known), '0')
+        return iter([(e, seen[e] == '1') for e, bit in enumerate(known) if bit == '1'])
+
+
+class MutationBatcher(object):
+    """
+    Collects watch/unwatch changes and sends them in as few requests as possible:
+    one multi-episode request per show, one request for all movies and a single
+    watchlist re-add for everything that was touched.
+    """
+
+    def __init__(self, api, watch=True):
+        self.api      = api
+        self.watch    = watch
+        self.shows    = []
+        self.seasons  = []
+        self.episodes = {}
+        self.movies   = []
+        self.touched  = []
+        self.failures = []
+
+    def add_watchlist(self, show_id):
+        """Only re-adds the show to the watchlist"""
+        if show_id not in self.touched:
+            self.touched.append(show_id)
+
+    def add_show(self, show_id):
+        self.add_watchlist(show_id)
+        if show_id not in self.shows:
+            self.shows.append(show_id)
+
+    def add_season(self, show_id, season):
+        self.add_watchlist(show_id)
+        if (show_id, season) not in self.seasons:
+            self.seasons.append((show_id, season))
+
+    def add_episode(self, show_id, season, episode):
+        self.add_watchlist(show_id)
+        episodes = self.episodes.setdefault(show_id, [])
+        if {'season': season, 'episode': episode} not in episodes:
+            episodes.append({'season': season, 'episode': episode})
+
+    def add_movie(self, movie):
+        if movie not in self.movies:
+            self.movies.append(movie)
+
+    def calls(self):
+        """Returns the pending requests as (item labels, method name, kwargs) tuples"""
+        calls = []
+        for show_id in self.shows:
+            calls.append((["show %s" % show_id], 'post_show_seen', {'tvdb_id': show_id}))
+        for show_id, season in self.seasons:
+            calls.append((["show %s season %s" % (show_id, season)], 'post_show_season_seen', {'tvdb_id': show_id, 'season': season}))
+        for show_id in self.touched:
+            if self.episodes.get(show_id):
+                episodes = self.episodes[show_id]
+                labels = ["show %s %02dx%02d" % (show_id, e['season'], e['episode']) for e in episodes]
+                method = 'post_show_episode_seen' if self.watch else 'post_show_episode_unseen'
+                calls.append((labels, method, {'tvdb_id': show_id, 'episodes': episodes}))
+        if self.touched:
+            calls.append((["watchlist show %s" % show_id for show_id in self.touched], 'post_show_watchlist',
+                          {'shows': [{'tvdb_id': show_id} for show_id in self.touched]}))
+        if self.movies:
+            labels = [TraktTvAPI._movie_label(m) for m in self.movies]
+            calls.append((labels, 'post_movie_seen' if self.watch else 'post_movie_unseen', {'movies': self.movies}))
+            calls.append((["watchlist %s" % l for l in labels], 'post_movie_watchlist', {'movies': self.movies}))
+        return calls
+
+    def flush(self, progress=iter):
+        """Sends every pending request, returns the (item, reason) pairs that failed"""
+        for labels, method, kwargs in progress(self.calls()):
+            try:
+                result = getattr(self.api, method)(**kwargs)
+            except urllib2.URLError, e:
+                self.failures.extend((label, str(e)) for label in labels)
+                continue
+            if isinstance(result, dict):
+                for movie in result.get('skipped_movies') or []:
+                    self.failures.append((TraktTvAPI._movie_label(movie), 'skipped'))
+        self.shows, self.seasons, self.episodes, self.movies, self.touched = [], [], {}, [], []
+        return self.failures
+
+
+class EpisodePlanner(object):
+    """
+    Turns episode commands into as few MutationBatcher requests as possible.
+    Ranges stay (season, episode) intervals; the season episode counts from
+    get_show_seasons tell when one covers whole seasons or the whole show.
+    Those counts may be a day old, so seasons and episodes past them are
+    still sent when the command names them.
+
+    Commands are space separated, the leading number being the short show id:
+      2             the whole show          1-3         shows 1 to 3
+      2x3           season 3                2x1-3       seasons 1 to 3
+      2x3x10        episode 3x10            2x3x1-10    episodes 3x01 to 3x10
+      2x1x5-3x24    episodes 1x05 to 3x24
+    """
+
+    def __init__(self, api):
+        self.api     = api
+        self.counts  = {}
+        self.unknown = []
+        self.skipped = []
+
+    @staticmethod
+    def parse(command):
+        """Returns (short id, start, end) tuples, start and end being (season, episode) or None for the whole show; raises ValueError"""
+        plan = []
+        for token in command.strip().split():
+            head, x, rest = token.partition('x')
+            if x and not rest:
+                raise ValueError(token)
+            if not rest:
+                first, dash, last = head.partition('-')
+                if dash and not last:
+                    raise ValueError(token)
+                for short_id in range(int(first), int(last or first) + 1):
+                    plan.append((short_id, None, None))
+                continue
+
+            lo, dash, hi = rest.partition('-')
+            if dash and not hi:
+                raise ValueError(token)
+            lo = [int(p) for p in lo.split('x')]
+            hi = [int(p) for p in hi.split('x')] if hi else None
+            if 2 < len(lo) or (hi and 2 < len(hi)):
+                raise ValueError(token)
+            if hi is None:
+                start, end = (lo[0], lo[1] if 1 < len(lo) else 1), (lo[0], lo[1] if 1 < len(lo) else None)
+            elif len(lo) == 2 and len(hi) == 1:
+                start, end = (lo[0], lo[1]), (lo[0], hi[0])
+            else:
+                start, end = (lo[0], lo[1] if 1 < len(lo) else 1), (hi[0], hi[1] if 1 < len(hi) else None)
+            if end[0] < start[0] or (end[1] is not None and end < start):
+                raise ValueError(token)
+            plan.append((int(head), start, end))
+        return plan
+
+    def season_counts(self, show_id):
+        """{season: episodes} for the show, looked up once per show"""
+        if show_id not in self.counts:
+            self.counts[show_id] = dict((int(s['season']), int(s['episodes'])) for s in self.api.get_show_seasons(show_id))
+        return self.counts[show_id]
+
+    def plan(self, commands, short_ids, batch):
+        """
+        Queues the requests for commands in batch. Unknown short ids end up in
+        self.unknown, (short id, season) pairs that couldn't be expanded into
+        episodes in self.skipped.
+        """
+        for short_id, start, end in commands:
+            show_id = short_ids.get(short_id)
+            if show_id is None:
+                self.unknown.append(short_id)
+                continue
+            if start is None and batch.watch:
+                batch.add_show(show_id)
+                continue
+            if start is not None and start == end:
+                batch.add_episode(show_id, start[0], start[1])
+                continue
+
+            counts = self.season_counts(show_id)
+            if start is None:
+                start, end = (min(counts or [1]), 1), (max(counts or [1]), None)
+
+            # Seasons the counts know of, plus the ones the command names itself
+            seasons = set(s for s in counts if start[0] <= s <= end[0]) | set([start[0], end[0]])
+            full, partial = [], []
+            for season in sorted(seasons):
+                first = start[1] if season == start[0] else 1
+                last  = end[1] if season == end[0] and end[1] is not None else counts.get(season)
+                if last is None and first != 1:
+                    # From an episode to the end of a season of unknown length
+                    self.skipped.append((short_id, season))
+                elif first == 1 and (last is None or counts.get(season, last + 1) <= last):
+                    full.append(season)
+                else:
+                    partial.extend((season, e) for e in range(first, last + 1))
+
+            known = set(s for s in counts if counts[s])
+            if batch.watch and full and known and known <= set(full):
+                batch.add_show(show_id)
+                continue
+            for season in full:
+                if batch.watch:
+                    batch.add_season(show_id, season)
+                    continue
+                # There is no season unseen, list its episodes instead
+                last = end[1] if season == end[0] and end[1] is not None else counts.get(season)
+                if last is None:
+                    self.skipped.append((short_id, season))
+                else:
+                    partial.extend((season, e) for e in range(1, max(last, counts.get(season, 0)) + 1))
+            for season, episode in sorted(partial):
+                batch.add_episode(show_id, season, episode)
+        return batch
+
+    @staticmethod
+    def describe(calls):
+        """Human readable lines for MutationBatcher.calls()"""
+        lines = []
+        for labels, method, kwargs in calls:
+            if 'episodes' in kwargs:
+                spans, previous = [], None
+                for e in kwargs['episodes']:
+                    if previous and previous[0] == e['season'] and previous[2] + 1 == e['episode']:
+                        previous[2] = e['episode']
+                    else:
+                        previous = [e['season'], e['episode'], e['episode']]
+                        spans.append(previous)
+                what = "tvdb %s %s" % (kwargs['tvdb_id'], " ".join(
+                    '%02dx%02d' % (s, a) if a == b else '%02dx%02d-%02dx%02d' % (s, a, s, b) for s, a, b in spans))
+            elif 'season' in kwargs:
+                what = "tvdb %s season %s" % (kwargs['tvdb_id'], kwargs['season'])
+            elif 'tvdb_id' in kwargs:
+                what = "tvdb %s" % kwargs['tvdb_id']
+            elif 'shows' in kwargs:
+                what = "tvdb %s" % ", ".join(str(show['tvdb_id']) for show in kwargs['shows'])
+            else:
+                what = ", ".join(labels)
+            lines.append("%s %s" % (method, what))
+        return lines
+
+
+class AccountSync(object):
+    """
+    Saves the library, watchlists and watch progress of many accounts as
+    <output>/<user>/<section>.json.
+
+    The accounts share one transport and RequestScheduler, so --rate limits
+    the whole run and connections are reused between accounts. Every fetch,
+    whichever account it belongs to, goes through the same jobs threads.
+    """
+
+    SECTIONS = (
+        ('library_shows',    'user/library/shows/all'),
+        ('library_movies',   'user/library/movies/all'),
+        ('watchlist_shows',  'user/watchlist/shows'),
+        ('watchlist_movies', 'user/watchlist/movies'),
+    )
+
+    def __init__(self, apis, output, jobs=4):
+        self.apis     = apis
+        self.output   = output
+        self.jobs     = jobs
+        self.written  = collections.defaultdict(list)
+        self.failures = []
+
+    @staticmethod
+    def read_configs(paths):
+        """
+        Reads the [TraktTv] apikey, user and password of every config in paths,
+        directories are read file by file. Returns (accounts, skipped paths).
+        """
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if os.path.isfile(os.path.join(path, name)))
+            else:
+                files.append(path)
+
+        accounts, skipped = [], []
+        for path in files:
+            config = ConfigParser.RawConfigParser()
+            try:
+                config.read(path)
+                accounts.append(tuple(config.get('TraktTv', option) for option in ('apikey', 'user', 'password')))
+            except ConfigParser.Error:
+                skipped.append(path)
+        return accounts, skipped
+
+    def _write(self, api, name, data):
+        directory = os.path.join(self.output, api.user)
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Written aside and renamed so a reader never sees half a file
+        filename = os.path.join(directory, name + '.json')
+        with open(filename + '.tmp', 'wb') as f:
+            json.dump(data, f)
+        os.rename(filename + '.tmp', filename)
+        self.written[api.user].append(name)
+
+    def _section(self, task):
+        api, name, path = task
+        try:
+            data = getattr(api, 'get_' + path.replace('/', '_'))(api.user)
+        except urllib2.URLError, e:
+            self.failures.append((api.user, name, e))
+            return api, name, None
+        self._write(api, name, data)
+        return api, name, data
+
+    def _progress(self, task):
+        api, show_ids = task
+        try:
+            return api, api.progress_watched(*show_ids)
+        except urllib2.URLError, e:
+            self.failures.append((api.user, 'progress', e))
+            return api, None
+
+    def run(self):
+        tasks = [(api, name, path) for api in self.apis for name, path in self.SECTIONS]
+        shows = {}
+        for api, name, data in TraktTvAPI.imap(self._section, tasks, self.jobs):
+            if name == 'library_shows' and data is not None:
+                shows[api] = [show['tvdb_id'] for show in data]
+
+        # Progress needs the library's show ids, so it is fetched in a second pass
+        chunks = [(api, ids[i:i + TraktTvAPI.PROGRESS_CHUNK]) for api, ids in shows.items() for i in range(0, len(ids), TraktTvAPI.PROGRESS_CHUNK)]
+        progress = dict((api, []) for api in shows)
+        for api, data in TraktTvAPI.imap(self._progress, chunks, self.jobs):
+            if data is None or progress.get(api) is None:
+                progress[api] = None
+            else:
+                progress[api].extend(data)
+
+        for api, data in progress.items():
+            if data is not None:
+                self._write(api, 'progress', data)
+        return self
+
+
+class Renderer(object):
+    """
+    Buffers a view and writes it to the stream once per flush. Text is only
+    coloured when the stream is a terminal (or CLINT_FORCE_COLOR is set), json
+    is a single array of records and tsv a header line plus a line per record.
+    """
+
+    FORMATS = ('text', 'json', 'tsv')
+
+    def __init__(self, format='text', columns=(), stream=None):
+        self.format  = format
+        self.columns = columns
+        self.stream  = stream or sys.stdout
+        self.color   = self.stream.isatty() or bool(os.environ.get('CLINT_FORCE_COLOR'))
+        self.records = 0
+        self._buffer = []
+
+    def paint(self, text, color):
+        if not self.color:
+            return text
+        # clint decides on sys.stdout, the stream was checked above
+        return str(getattr(colored, color)(text, always=True))
+
+    def text(self, line='', quote=''):
+        """Adds a line to the text view, the other formats leave it out"""
+        if self.format == 'text':
+            self._buffer.append("%s%s\n" % (quote, line))
+
+    @staticmethod
+    def _field(value):
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return json.dumps(value)
+        if isinstance(value, unicode):
+            value = value.encode('utf8')
+        return str(value).replace('\t', ' ').replace('\n', ' ')
+
+    def record(self, record):
+        """Adds a record to the json or tsv view, the text view leaves it out"""
+        if self.format == 'json':
+            self._buffer.append('%s%s' % (',\n' if self.records else '[\n', json.dumps(record, default=Model.encode)))
+        elif self.format == 'tsv':
+            if not self.records:
+                self._buffer.append('\t'.join(self.columns) + '\n')
+            self._buffer.append('\t'.join(Renderer._field(record.get(c)) for c in self.columns) + '\n')
+        self.records += 1
+
+    def flush(self):
+        if self._buffer:
+            self.stream.write(''.join(self._buffer))
+            self.stream.flush()
+            self._buffer = []
+
+    def close(self):
+        if self.format == 'json':
+            self._buffer.append('\n]\n' if self.records else '[]\n')
+        elif self.format == 'tsv' and not self.records:
+            self._buffer.append('\t'.join(self.columns) + '\n')
+        self.flush()
 
 
 class TraktTvController(object):
 
-    def __init__(self):
-        self.arguments = docopt(__doc__, version='TraktTvPy 0.1')
-        self.api = None
-        self.auth()
-        self.run()
+    # Decompressed responses the daemon keeps in memory, per store
+    DAEMON_MEMORY = 256
+
+    # Fields of the json and tsv views, in tsv column order
+    SHOW_COLUMNS  = ('id', 'tvdb_id', 'imdb_id', 'year', 'title', 'unwatched')
+    MOVIE_COLUMNS = ('id', 'tmdb_id', 'imdb_id', 'year', 'title', 'watched')
+
+    def __init__(self, argv=None, api=None):
+        _load_ui()
+        self.arguments = docopt(__doc__, argv=argv, version='TraktTvPy 0.1')
+        # Attached to every api _connect builds, sync-all has one per account
+        self.profiler = RequestProfiler() if self.arguments.get('--profile') else None
+        self.api = api
+        if self.api is None and not self.arguments.get('sync-all'):
+            self.auth()
+        elif self.api is not None and self.profiler:
+            self.profiler.attach(self.api)
+
+        if not self.profiler:
+            self.run()
+            return
+        start = time.time()
+        try:
+            self.run()
+        finally:
+            self.profiler.detach()
+            for line in self.profiler.report(time.time() - start):
+                puts(line, stream=sys.stderr.write)
 
     def run(self):
-        for command in ('auth','search','watchlist', 'moviesearch', 'moviewatchlist'):
-            if self.arguments.get(command, False) == True and hasattr(self, command):
-                return getattr(self, command)()
+        if self.arguments.get('--format', 'text') not in Renderer.FORMATS:
+            puts(colored.red('Unknown format %s, use one of %s' % (self.arguments['--format'], ', '.join(Renderer.FORMATS))))
+            return
+        for command in ('auth','search','watchlist', 'moviesearch', 'moviewatchlist', 'daemon', 'sync-all'):
+            if self.arguments.get(command, False) == True and hasattr(self, command.replace('-', '_')):
+                return getattr(self, command.replace('-', '_'))()
 
 
     def auth(self):
         ini = SimpleIniFiller('.trakttvpy', {
             'TraktTv' : ['apikey', 'user', 'password']
         })
-        self.api = TraktTvAPI(ini.config['TraktTv']['apikey'], ini.config['TraktTv']['user'], ini.config['TraktTv']['password'])
+        config = ini.config['TraktTv']
+        self.api = self._connect((config['apikey'], config['user'], config['password']))[0]
+
+
+    def _connect(self, *accounts):
+        """Returns a TraktTvAPI per (apikey, user, password), all sharing one transport, scheduler and cache"""
+        transport = HttpTransport(pool_size=self._jobs(), timeout=float(self.arguments.get('--timeout') or 30))
+        memory = self.DAEMON_MEMORY if self.arguments.get('daemon') else 0
+        cache, mirror = (None, None) if self.arguments.get('--no-cache') else (ResponseCache(memory=memory), LibraryMirror(memory=memory))
+        scheduler = RequestScheduler(transport, rate=float(self.arguments.get('--rate') or 0))
+        apis = [TraktTvAPI(apikey, user, password, transport, cache=cache, refresh=self.arguments.get('--refresh', False), mirror=mirror, scheduler=scheduler)
+                for apikey, user, password in accounts]
+        if self.profiler:
+            for api in apis:
+                self.profiler.attach(api)
+        return apis
+
+
+    def _prompt(self, text):
+        if self._text_output():
+            return raw_input(text)
+        # raw_input prompts on stdout, which carries the json or tsv
+        sys.stderr.write(text)
+        line = sys.stdin.readline()
+        if not line:
+            raise EOFError
+        return line.rstrip('\n')
+
+
+    def _say(self, text):
+        """Status messages, kept off stdout when it carries json or tsv"""
+        puts(text, stream=None if self._text_output() else sys.stderr.write)
+
+
+    def _text_output(self):
+        return (self.arguments.get('--format') or 'text') == 'text'
+
+
+    def _progress(self, items):
+        return progress_bar.bar(items)
+
+
+    def _renderer(self, columns=()):
+        return Renderer(self.arguments.get('--format') or 'text', columns)
+
+
+    def _jobs(self):
+        return max(1, int(self.arguments.get('--jobs') or 1))
+
+
+    def daemon(self):
+        client = DaemonClient()
+        if self.arguments.get('--stop'):
+            puts(colored.green('Daemon stopped') if client.stop() else colored.yellow('No daemon running'))
+            return
+        if client.running():
+            puts(colored.yellow('Daemon already running on %s' % client.path))
+            return
+
+        server = TraktTvDaemon(self.api, client.path)
+        puts(colored.green('[Serving on %s]' % client.path))
+        try:
+            server.serve_until_stopped()
+        finally:
+            server.server_close()
+            os.unlink(client.path)
+
+
+    def sync_all(self):
+        accounts, skipped = AccountSync.read_configs(self.arguments['<config>'])
+        for path in skipped:
+            puts(colored.yellow('No [TraktTv] apikey, user and password in %s - Skipping' % path))
+        if not accounts:
+            puts(colored.yellow('No accounts to sync'))
+            return
+
+        puts(colored.yellow('[Syncing %d accounts]' % len(accounts)))
+        sync = AccountSync(self._connect(*accounts), self.arguments['--output'], self._jobs()).run()
+        for user, name, reason in sync.failures:
+            puts(colored.red('Failed: %s %s (%s)' % (user, name, reason)))
+        for apikey, user, password in accounts:
+            puts("%s %s" % (colored.green('[ok]') if user in sync.written else colored.red('[  ]'), user))
 
 
     ##
@@ -143,8 +1835,8 @@ class TraktTvController(object):
 
         # ADD TO WATCHLIST
         if self.arguments.get('--add'):
-            add_ids = raw_input('Enter Show IDs to add to watchlist (space separated): ').split(' ')
-            self._add_shows_to_watchlist(*TraktTvController._short_id_to_tvdb_id(short_ids, add_ids))
+            add_ids = self._prompt('Enter Show IDs to add to watchlist (space separated): ').split(' ')
+            self._add_shows_to_watchlist(*self._short_id_to_tvdb_id(short_ids, add_ids))
 
 
     def watchlist(self):
@@ -154,163 +1846,163 @@ class TraktTvController(object):
         short_ids = self.__display_shows(results[:limit], show_short_ids)
 
         if self.arguments.get('--delete'):
-            remove_ids = raw_input('Enter Show IDs to remove from watchlist (space separated): ').split(' ')
-            self._remove_shows_from_watchlist(*TraktTvController._short_id_to_tvdb_id(short_ids, remove_ids))
+            remove_ids = self._prompt('Enter Show IDs to remove from watchlist (space separated): ').split(' ')
+            self._remove_shows_from_watchlist(*self._short_id_to_tvdb_id(short_ids, remove_ids))
 
         if self.arguments.get('--unwatch'):
-            command = raw_input('Enter episodes you haven\'t watched (Ie: 2x3x10 2x3-3x3): ')
+            command = self._prompt('Enter episodes you haven\'t watched (Ie: 2x3x10 2x1-3 2x1x5-3x24): ')
             self._watch_unwatch(command, short_ids, False)
 
         if self.arguments.get('--watch'):
-            command = raw_input('Enter episodes you\'ve watched (Ie: 2x3x10 2x3-3x3): ')
+            command = self._prompt('Enter episodes you\'ve watched (Ie: 2x3x10 2x1-3 2x1x5-3x24): ')
             self._watch_unwatch(command, short_ids)
 
 
     def _watch_unwatch(self, command, short_ids, watch=True):
-        commands = TraktTvController.__parse_command(command)
-        if not command:
+        planner = EpisodePlanner(self.api)
+        try:
+            commands = planner.parse(command)
+        except ValueError:
+            self._say(colored.red("Invalid range syntax"))
+            return
+        if not commands:
             return
 
-        for command in progress_bar.bar(commands):
-            show_id    = short_ids[command[0]]
-            season_id  = command[1]
-            episode_id = command[2]
-
-            if season_id == -1 and episode_id == -1: # SHOW
-                if watch:
-                    self.api.post_show_seen(tvdb_id=show_id)
-                else:
-                    puts(colored.yellow('Cannot "unsee" a show - Skipping'))
+        batch = planner.plan(commands, short_ids, MutationBatcher(self.api, watch))
+        for short_id in planner.unknown:
+            self._say(colored.yellow('Unknown show ID %s - Skipping' % short_id))
+        for short_id, season in planner.skipped:
+            self._say(colored.yellow('Episode count of show %s season %s unknown, give its episodes (Ie: %sx%sx1-10) - Skipping' % (short_id, season, short_id, season)))
 
+        if self.arguments.get('--dry-run'):
+            for line in EpisodePlanner.describe(batch.calls()):
+                self._say(line)
+            return
+        self._report_failures(batch.flush(self._progress))
 
-            elif episode_id == -1: # SEASON
-                if watch:
-                    self.api.post_show_season_seen(tvdb_id=show_id, season=season_id)
-                else:
-                    puts(colored.yellow('Cannot "unsee" a season - Skipping'))
 
-            else: # EPISODE
-                if watch:
-                    self.api.post_show_episode_seen(tvdb_id=show_id, episodes=[{'season':season_id, 'episode':episode_id}])
-                else:
-                    self.api.post_show_episode_unseen(tvdb_id=show_id, episodes=[{'season':season_id, 'episode':episode_id}])
-            self.api.post_show_watchlist(shows=[{"tvdb_id": show_id},])
+    def _report_failures(self, failures):
+        for item, reason in failures:
+            self._say(colored.red('Failed: %s (%s)' % (item, reason)))
 
 
     def _add_shows_to_watchlist(self, *args):
         if 0 < len(args):
             shows_to_add = [{"tvdb_id": add_id} for add_id in args]
             add_result = self.api.post_show_watchlist(shows=shows_to_add)
-            puts(colored.green('Shows added'))
+            self._say(colored.green('Shows added'))
         else:
-            puts(colored.yellow('No shows added'))
+            self._say(colored.yellow('No shows added'))
 
 
     def _remove_shows_from_watchlist(self, *args):
         if 0 < len(args):
             shows_to_remove = [{"tvdb_id": add_id} for add_id in args]
             remove_result = self.api.post_show_unwatchlist(shows=shows_to_remove)
-            puts(colored.green('Shows removed'))
+            self._say(colored.green('Shows removed'))
         else:
-            puts(colored.yellow('No shows removed'))
+            self._say(colored.yellow('No shows removed'))
 
 
     def __display_shows(self, shows, include_ids=False):
 
-        id            = 0
         ids           = {}
-        progress_dict = {}
-        episode_dict  = {}
-        skip_lookup   = False
-
-        # GET WATCHED
-        show_ids  = [s['id'] for s in shows]
-        watchlist = ",".join([str(s) for s in show_ids])
-
-        puts(colored.yellow('[Updating show Info]'))
-
-        details = self.arguments.get('--details', False)
-
-        if not (self.arguments.get('-s', False) or  self.arguments.get('--skip-watch-info', False)):
-            progress = self.api.get_user_progress_watched(self.api.user, watchlist)
-            for s in progress:
-                if s['show']['tvdb_id'] and 0 < int(s['show']['tvdb_id']):
-                    progress_dict[int(s['show']['tvdb_id'])] = int(s['progress']['left'])
-            if details:
-                episode_dict = self.__progress_to_episode_array(progress)
-
-            # GET OTHER EPISODE INFO
-            for show_id in progress_bar.bar(show_ids):
-                if -1 == progress_dict.get(int(show_id), -1):
-                    show_seasons = self.api.get_show_seasons(show_id)
-                    total_episodes = sum([int(s['episodes']) for s in show_seasons])
-                    progress_dict[int(show_id)] = int(total_episodes)
-                    if details:
-                        if not episode_dict.get(show_id):
-                            episode_dict[int(show_id)] = {}
-                        for season in show_seasons:
-                            for episode in range(1,int(season['episodes'])+1):
-                                sk = int(season['season'])
-                                if not episode_dict[int(show_id)].get(sk):
-                                    episode_dict[int(show_id)][sk] = {}
-                                episode_dict[int(show_id)][sk][int(episode)] = False
+        skip_lookup   = self.arguments.get('-s', False) or self.arguments.get('--skip-watch-info', False)
+        details       = self.arguments.get('--details', False) or self.arguments.get('-d', False)
+        todo          = self.arguments.get('--todo')
+        out           = self._renderer(self.SHOW_COLUMNS)
+
+        out.text(out.paint('[Updating show Info]', 'yellow'))
+        out.flush()
+
+        # GET WATCHED, one chunk of shows per request, rendered as soon as its chunk is in
+        chunks = [shows[i:i + TraktTvAPI.PROGRESS_CHUNK] for i in range(0, len(shows), TraktTvAPI.PROGRESS_CHUNK)]
+        if skip_lookup:
+            results = [({}, {}) for chunk in chunks]
         else:
-            skip_lookup=True
-
-
-        def watched(unwatched_episodes, f='[{n:1}]'):
-            if not unwatched_episodes:
-                return colored.green('[ok]')
-            else:
-                return colored.red(f.format(n=unwatched_episodes))
+            results = self.api.imap(self.__fetch_show_info, chunks, self._jobs())
 
         # SHOW
-        puts(colored.yellow('\n[Shows]'))
+        out.text()
+        out.text(out.paint('[Shows]', 'yellow'))
         format_str = "[{n:%s}]" % str(len(str(len(shows))))
-        format_unwatched_episodes = "[{n:%s}]" % str(len(str(max([progress_dict[i] for i in progress_dict]))))
-        for show in shows:
-            unwatched_episodes = progress_dict.get(int(show['id']), 0)
-            if (unwatched_episodes and self.arguments.get('--todo')) or not self.arguments.get('--todo'):
-                w = colored.yellow('[skip]') if skip_lookup else watched(unwatched_episodes, format_unwatched_episodes)
+        for chunk, (progress_dict, episode_dict) in itertools.izip(chunks, results):
+            for show in chunk:
+                unwatched_episodes = progress_dict.get(int(show.id), 0)
+                if todo and not unwatched_episodes:
+                    continue
+                short_id = None
                 if include_ids:
-                    id += 1
-                    ids[id] = int(show['id'])
-                    puts("%s %s %s" % (
-                        w,
-                        colored.yellow(format_str.format(n=id)),
-                        show['title'].encode('utf8'),
-                    ))
+                    short_id = len(ids) + 1
+                    ids[short_id] = int(show.id)
+                seasons = sorted(episode_dict.get(int(show.id), {}).items()) if details else []
+
+                if out.format != 'text':
+                    record = {'id': short_id, 'title': show.title, 'year': show.year, 'tvdb_id': show.tvdb_id, 'imdb_id': show.imdb_id,
+                              'unwatched': None if skip_lookup else unwatched_episodes}
+                    if details:
+                        record['seasons'] = [{'season': number, 'episodes': dict((str(e), seen) for e, seen in season)} for number, season in seasons]
+                    out.record(record)
+                    continue
+
+                if skip_lookup:
+                    w = out.paint('[skip]', 'yellow')
+                elif not unwatched_episodes:
+                    w = out.paint('[ok]', 'green')
                 else:
-                    puts("%s %s" % (
-                        w,
-                        show['title'].encode('utf8'),
-                    ))
+                    w = out.paint('[{n:3}]'.format(n=unwatched_episodes), 'red')
+                label = "%s " % out.paint(format_str.format(n=short_id), 'yellow') if include_ids else ''
+                out.text("%s %s%s" % (w, label, show.title.encode('utf8')))
 
                 # DISPLAY SEASONS
-                if self.arguments.get('--details', False) or self.arguments.get('-d', False):
-                    with indent(2, quote='|'):
-                        show_id = int(show['id'])
-                        for _season in episode_dict[show_id].keys():
-                            puts('Season %s' % _season)
-                            with indent(1, quote='|'):
-                                txt = ''
-                                i = 0
-                                for _episode in sorted(episode_dict[show_id][_season].keys()):
-                                    i += 1
-                                    txt = txt + ' '
-                                    if episode_dict[show_id][_season][_episode]:
-                                        txt = txt + colored.green('[%02dx%02d]' % (_season, _episode))
-                                    else:
-                                        txt = txt + colored.red('[%02dx%02d]' % (_season, _episode))
-
-                                    if not divmod(i,7)[1]:
-                                        puts(txt)
-                                        txt = ''
-                                if len(txt):
-                                    puts(txt)
+                for number, season in seasons:
+                    if todo and not season.unwatched_count():
+                        continue
+                    out.text('Season %s' % number, '| ')
+                    cells = [out.paint('[%02dx%02d]' % (number, e), 'green' if seen else 'red') for e, seen in (season.unwatched() if todo else season)]
+                    for i in range(0, len(cells), 7):
+                        out.text(' ' + ' '.join(cells[i:i + 7]), '| |')
+            out.flush()
+        out.close()
         return ids
 
 
+    def __fetch_show_info(self, shows):
+        """Returns (progress_dict, episode_dict) for one chunk of shows"""
+        progress_dict = {}
+        episode_dict  = {}
+        show_ids      = [s.id for s in shows]
+        details       = self.arguments.get('--details', False)
+
+        for progress in self.api.iter_progress_watched(*show_ids):
+            if progress.id and 0 < int(progress.id):
+                progress_dict[int(progress.id)] = progress.left
+            if details:
+                self.__add_progress_episodes(episode_dict, progress)
+
+        # GET OTHER EPISODE INFO
+        missing = []
+        for show_id in show_ids:
+            if -1 == progress_dict.get(int(show_id), -1) and show_id not in missing:
+                missing.append(show_id)
+        summaries = SummaryBatcher(self.api, 'show', 'full')
+        summaries.add(*missing)
+        summaries.flush()
+
+        for show_id in missing:
+            # Summaries normally carry the seasons, only look them up when they don't
+            summary = summaries.get(show_id)
+            show_seasons = summary['seasons'] if summary and summary.get('seasons') else self.api.get_show_seasons(show_id)
+            seasons = [(season.season, season.count) for season in itertools.imap(Season, show_seasons)]
+            progress_dict[int(show_id)] = sum([count for season, count in seasons])
+            if details:
+                if not episode_dict.get(int(show_id)):
+                    episode_dict[int(show_id)] = {}
+                for season, count in seasons:
+                    episode_dict[int(show_id)][season] = SeasonState(count)
+        return progress_dict, episode_dict
+
+
     ##
     # MOVIES
     ##
@@ -320,8 +2012,8 @@ class TraktTvController(object):
 
         # ADD TO WATCHLIST
         if self.arguments.get('--add'):
-            add_ids = raw_input('Enter Movie IDs to add to watchlist (space separated): ').split(' ')
-            self._add_movies_to_watchlist(*TraktTvController._short_id_to_tvdb_id(short_ids, add_ids))
+            add_ids = self._prompt('Enter Movie IDs to add to watchlist (space separated): ').split(' ')
+            self._add_movies_to_watchlist(*self._short_id_to_tvdb_id(short_ids, add_ids))
 
 
     def moviewatchlist(self):
@@ -331,73 +2023,57 @@ class TraktTvController(object):
         short_ids = self.__display_movies(results[:limit], movie_short_ids)
 
         if self.arguments.get('--delete'):
-            remove_ids = raw_input('Enter Movie IDs to remove from watchlist (space separated): ').split(' ')
-            self._remove_movies_from_watchlist(*TraktTvController._short_id_to_tvdb_id(short_ids, remove_ids))
+            remove_ids = self._prompt('Enter Movie IDs to remove from watchlist (space separated): ').split(' ')
+            self._remove_movies_from_watchlist(*self._short_id_to_tvdb_id(short_ids, remove_ids))
 
         if self.arguments.get('--unwatch'):
-            command = raw_input('Enter movies you haven\'t watched (Ie: 2 3): ')
+            command = self._prompt('Enter movies you haven\'t watched (Ie: 2 3): ')
             self._watch_unwatch_movies(command, short_ids, False)
 
         if self.arguments.get('--watch'):
-            command = raw_input('Enter movies you\'ve watched (Ie: 2 3): ')
+            command = self._prompt('Enter movies you\'ve watched (Ie: 2 3): ')
             self._watch_unwatch_movies(command, short_ids)
 
 
     def __display_movies(self, movies, include_ids=False):
 
-        id            = 0
         ids           = {}
         progress_dict = {}
-        skip_lookup   = False
-
+        skip_lookup   = self.arguments.get('-s', False) or self.arguments.get('--skip-watch-info', False)
+        out           = self._renderer(self.MOVIE_COLUMNS)
 
-        puts(colored.yellow('[Updating movie Info]'))
+        out.text(out.paint('[Updating movie Info]', 'yellow'))
+        out.flush()
 
-        details = self.arguments.get('--details', False)
-
-        if not (self.arguments.get('-s', False) or  self.arguments.get('--skip-watch-info', False)):
-            progress = self.api.get_user_library_movies_watched(self.api.user)
-            for s in progress:
+        if not skip_lookup:
+            for s in self.api.iter_watched_movies():
                 if s['tmdb_id'] and 0 < int(s['tmdb_id']):
                     progress_dict[int(s['tmdb_id'])] = True
-            if details:
-                episode_dict = self.__progress_to_episode_array(progress)
-        else:
-            skip_lookup=True
-
 
-        def watched(watched_movies):
-            if watched_movies:
-                return colored.green('[ok]')
-            else:
-                return colored.red('[  ]')
-
-        puts(colored.yellow('\n[Movies]'))
+        out.text()
+        out.text(out.paint('[Movies]', 'yellow'))
         format_str = "[{n:%s}]" % str(len(str(len(movies))))
         for movie in movies:
-            watched_movies = progress_dict.get(int(movie['id']), 0)
-            if (watched_movies and self.arguments.get('--todo')) or not self.arguments.get('--todo'):
-                w = colored.yellow('[skip]') if skip_lookup else watched(watched_movies)
-                if include_ids:
-                    id += 1
-                    ids[id] = [{
-                        "tmdb_id": movie["tmdb_id"],
-                        "imdb_id": movie["imdb_id"],
-                        "title": movie["title"],
-                        "year": movie["year"]
-                    }]
-                    puts("%s %s %s (%s)" % (
-                        w,
-                        colored.yellow(format_str.format(n=id)),
-                        movie['title'].encode('utf8'),
-                        movie['year'],
-                    ))
-                else:
-                    puts("%s %s (%s)" % (
-                        w,
-                        movie['title'].encode('utf8'),
-                        movie['year'],
-                    ))
+            watched_movies = progress_dict.get(int(movie.id), False)
+            if self.arguments.get('--todo') and not watched_movies:
+                continue
+            short_id = None
+            if include_ids:
+                short_id = len(ids) + 1
+                ids[short_id] = [movie]
+
+            if out.format != 'text':
+                out.record({'id': short_id, 'title': movie.title, 'year': movie.year, 'tmdb_id': movie.tmdb_id, 'imdb_id': movie.imdb_id,
+                            'watched': None if skip_lookup else watched_movies})
+                continue
+
+            if skip_lookup:
+                w = out.paint('[skip]', 'yellow')
+            else:
+                w = out.paint('[ok]', 'green') if watched_movies else out.paint('[  ]', 'red')
+            label = "%s " % out.paint(format_str.format(n=short_id), 'yellow') if include_ids else ''
+            out.text("%s %s%s (%s)" % (w, label, movie.title.encode('utf8'), movie.year))
+        out.close()
         return ids
 
 
@@ -405,42 +2081,43 @@ class TraktTvController(object):
         if 0 < len(movies):
             movies = [m[0] for m in movies]
             add_result = self.api.post_movie_watchlist(movies=movies)
-            puts(colored.green('Movies added'))
+            self._say(colored.green('Movies added'))
         else:
-            puts(colored.yellow('No movies added'))
+            self._say(colored.yellow('No movies added'))
 
 
     def _remove_movies_from_watchlist(self, *movies):
         if 0 < len(movies):
             movies = [m[0] for m in movies]
             remove_result = self.api.post_movie_unwatchlist(movies=movies)
-            puts(colored.green('Movies removed'))
+            self._say(colored.green('Movies removed'))
         else:
-            puts(colored.yellow('No movies removed'))
+            self._say(colored.yellow('No movies removed'))
 
 
     def _watch_unwatch_movies(self, command, short_ids, watch=True):
-        commands = TraktTvController.__parse_command(command)
-        if not command:
+        commands = self.__parse_command(command)
+        if not commands:
             return
-        for command in progress_bar.bar(commands):
-            movie_id = short_ids[command[0]]
-            if watch:
-                result = self.api.post_movie_seen(movies=movie_id)
-            else:
-                result = self.api.post_movie_unseen(movies=movie_id)
-            self.api.post_movie_watchlist(movies=movie_id)
+
+        batch = MutationBatcher(self.api, watch)
+        for command in commands:
+            if command[0] not in short_ids:
+                self._say(colored.yellow('Unknown movie ID %s - Skipping' % command[0]))
+                continue
+            for movie in short_ids[command[0]]:
+                batch.add_movie(movie)
+        self._report_failures(batch.flush(self._progress))
 
 
     ##
     # UNIWERSAL
     ##
-    @staticmethod
-    def _short_id_to_tvdb_id(short_ids, ids):
+    def _short_id_to_tvdb_id(self, short_ids, ids):
         try:
             return [short_ids[int(i)] for i in ids]
         except ValueError, e:
-            puts(colored.red("Operation Canceled"))
+            self._say(colored.red("Operation Canceled"))
             return []
 
     @staticmethod
@@ -473,42 +2150,276 @@ class TraktTvController(object):
                 a_list.append(el)
         return a_list
 
-    @staticmethod
-    def __parse_command(command):
+    def __parse_command(self, command):
         try:
             return TraktTvController.__pre_parse_command(command)
         except ValueError:
-            puts(colored.red("Invalid range syntax"))
+            self._say(colored.red("Invalid range syntax"))
             return None
 
 
-    def __progress_to_episode_array(self, progress):
-        episodes = {}
-        for show in progress:
-            show_id = show['show']['tvdb_id']
-            if show_id and 0 < int(show_id):
-                show_id = int(show_id)
-                if not episodes.get(show_id):
-                    episodes[show_id] = {}
-                for s in show['seasons']:
-                    season_id = int(s['season'])
-                    for e in s['episodes'].keys():
-                        if self.arguments.get('--todo'):
-                            if not s['episodes'][e]:
-                                if not episodes[show_id].get(season_id):
-                                    episodes[show_id][season_id] = {}
-                                episodes[show_id][season_id][int(e)] = s['episodes'][e]
-                        else:
-                            if not episodes[show_id].get(season_id):
-                                episodes[show_id][season_id] = {}
-                            episodes[show_id][season_id][int(e)] = s['episodes'][e]
+    def __add_progress_episodes(self, episodes, progress):
+        show_id = progress.id
+        if show_id and 0 < int(show_id):
+            show_id = int(show_id)
+            if not episodes.get(show_id):
+                episodes[show_id] = {}
+            for season in progress.seasons:
+                episodes[show_id].setdefault(season.season, SeasonState()).update(season.episodes)
         return episodes
 
 
-if __name__ == '__main__':
+class DaemonChannel(object):
+    """
+    Framed messages over the daemon socket: a "<kind> <length>" line followed
+    by length bytes of payload, so output is passed through byte for byte.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._file = sock.makefile('rb')
+
+    def send(self, kind, payload=''):
+        self.sock.sendall('%s %d\n%s' % (kind, len(payload), payload))
+
+    def receive(self):
+        """Returns (kind, payload), raises EOFError once the other side is gone"""
+        header = self._file.readline()
+        if not header.endswith('\n'):
+            raise EOFError
+        kind, length = header.split()
+        payload = self._file.read(int(length))
+        if len(payload) < int(length):
+            raise EOFError
+        return kind, payload
+
+
+class DaemonOutput(object):
+    """Stands in for sys.stdout/sys.stderr while the daemon runs a client's command"""
+
+    def __init__(self, channel, kind, tty):
+        self.channel = channel
+        self.kind    = kind
+        self.tty     = tty
+
+    def write(self, text):
+        if text:
+            self.channel.send(self.kind, text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self.tty
+
+
+class DaemonController(TraktTvController):
+    """TraktTvController sharing the daemon's api, prompts go back to the client"""
+
+    def __init__(self, channel, argv=None, api=None):
+        self.channel = channel
+        TraktTvController.__init__(self, argv, api)
+
+    def run(self):
+        self.api.refresh = self.arguments.get('--refresh', False)
+        try:
+            return TraktTvController.run(self)
+        finally:
+            self.api.refresh = False
+
+    def _prompt(self, text):
+        if not self._text_output():
+            sys.stderr.write(text)
+            text = ''
+        self.channel.send('prompt', text)
+        kind, payload = self.channel.receive()
+        if kind != 'input':
+            raise EOFError
+        return payload
+
+    def _progress(self, items):
+        # clint's bar draws on the daemon's own stderr
+        return iter(items)
+
+
+class DaemonHandler(SocketServer.BaseRequestHandler):
+
+    def handle(self):
+        channel = DaemonChannel(self.request)
+        try:
+            kind, payload = channel.receive()
+        except (EOFError, ValueError):
+            return
+        if kind == 'stop':
+            self.server.stopping = True
+            channel.send('exit', '0')
+            return
+        if kind != 'run':
+            return
+        if not self.server.busy.acquire(False):
+            # Another client's command (maybe waiting at a prompt) holds sys.stdout, this one runs in-process
+            channel.send('busy')
+            return
+        try:
+            self._run(channel, json.loads(payload))
+        finally:
+            self.server.busy.release()
+
+    def _run(self, channel, request):
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = DaemonOutput(channel, 'out', request['stdout_tty'])
+        sys.stderr = DaemonOutput(channel, 'err', request['stderr_tty'])
+        try:
+            try:
+                code = main(request['argv'], lambda argv: DaemonController(channel, argv, self.server.api))
+            except SystemExit, e:
+                # docopt exits on --help, --version and usage errors
+                if isinstance(e.code, basestring):
+                    sys.stderr.write(e.code + '\n')
+                code = 0 if e.code is None else 1 if isinstance(e.code, basestring) else e.code
+            except socket.error:
+                raise
+            except Exception:
+                # Reported to the client the way an in-process run would, the daemon keeps serving
+                sys.stderr.write(traceback.format_exc())
+                code = 1
+            channel.send('exit', str(code))
+        except socket.error:
+            # Client went away mid command
+            pass
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+
+class TraktTvDaemon(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """
+    Serves TraktTv.py commands over a Unix socket from one long lived
+    TraktTvAPI, keeping its connection pool, endpoint methods, lastactivity
+    and in-memory cache entries warm between commands.
+
+    Commands run one at a time since each swaps sys.stdout for its client;
+    clients arriving while one runs are told the daemon is busy.
+    """
+
+    SOCKET = '.trakttvpy.sock'
+
+    daemon_threads = True
+    # Seconds between checks of stopping while no client connects
+    timeout = 0.5
+
+    def __init__(self, api, path=SOCKET):
+        self.api      = api
+        self.stopping = False
+        self.busy     = threading.Lock()
+        if os.path.exists(path):
+            # Left behind by a daemon that didn't shut down cleanly
+            os.unlink(path)
+        umask = os.umask(0177)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, path, DaemonHandler)
+        finally:
+            os.umask(umask)
+
+    def serve_until_stopped(self):
+        while not self.stopping:
+            self.handle_request()
+        # Let a running command finish
+        with self.busy:
+            pass
+
+
+class DaemonClient(object):
+    """Forwards a command line to a running TraktTvDaemon"""
+
+    def __init__(self, path=TraktTvDaemon.SOCKET):
+        self.path = path
+
+    @staticmethod
+    def forwards(argv):
+        """Whether argv should go through the daemon rather than run in-process"""
+        return bool(argv) and argv[0] not in ('daemon', 'sync-all') and '--no-cache' not in argv
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except socket.error, e:
+            sock.close()
+            if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                return None
+            raise
+        return DaemonChannel(sock)
+
+    def running(self):
+        channel = self._connect()
+        if channel is None:
+            return False
+        channel.sock.close()
+        return True
+
+    def stop(self):
+        channel = self._connect()
+        if channel is None:
+            return False
+        channel.send('stop')
+        try:
+            channel.receive()
+        except EOFError:
+            pass
+        channel.sock.close()
+        return True
+
+    def forward(self, argv):
+        """Runs argv on the daemon, returns its exit status or None when no daemon is running or it is busy"""
+        channel = self._connect()
+        if channel is None:
+            return None
+        try:
+            channel.send('run', json.dumps({'argv': argv, 'stdout_tty': sys.stdout.isatty(), 'stderr_tty': sys.stderr.isatty()}))
+            while True:
+                try:
+                    kind, payload = channel.receive()
+                except EOFError:
+                    return 1
+                if kind == 'exit':
+                    return int(payload)
+                elif kind == 'busy':
+                    return None
+                elif kind == 'prompt':
+                    try:
+                        channel.send('input', raw_input(payload))
+                    except (EOFError, KeyboardInterrupt):
+                        channel.send('eof')
+                else:
+                    stream = sys.stderr if kind == 'err' else sys.stdout
+                    stream.write(payload)
+                    stream.flush()
+        except KeyboardInterrupt:
+            sys.stderr.write("\n[Exiting]\n")
+            return 1
+        finally:
+            channel.sock.close()
+
+
+def main(argv=None, controller=TraktTvController):
+    """Runs one command line, returns the exit status"""
+    _load_ui()
     try:
-        controller = TraktTvController()
-    except EOFError, KeyboardInterrupt:
+        controller(argv)
+    except (EOFError, KeyboardInterrupt):
         puts(colored.red("\n[Exiting]"))
+    except urllib2.HTTPError, e:
+        puts("Trakt API error %s %s " % (e.code, e.msg) + colored.red("[Exiting]"))
+        return 1
     except urllib2.URLError:
         puts("No Internet connection available " + colored.red("[Exiting]"))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    status = DaemonClient().forward(argv) if DaemonClient.forwards(argv) else None
+    if status is None:
+        status = main(argv)
+    sys.exit(status)
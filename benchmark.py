@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+TraktTvPy benchmarks
+
+Runs the TraktTvController flows against a local stand-in for api.trakt.tv
+and reports wall time, requests, bytes transferred and peak memory for each.
+
+Usage:
+  benchmark.py run [<scenario>...] [options]
+  benchmark.py serve [options]
+  benchmark.py child <url> <scenario> [options]
+  benchmark.py episodes [options]
+  benchmark.py models [--items=<items>] [options]
+  benchmark.py models-child <json> <builder> [options]
+
+  benchmark.py -h | --help
+
+Scenarios:
+  search, watchlist, details, moviewatchlist, watch
+
+Options:
+ --shows=<shows>            Number of shows in the synthetic library [default: 500]
+ --movies=<movies>          Number of movies in the synthetic library [default: 200]
+ --seed=<seed>              Random seed for the synthetic library [default: 1]
+ --latency=<ms>             Added latency per request in milliseconds [default: 50]
+ --fixtures=<dir>           Directory of recorded responses, named after the endpoint (show_seasons.json)
+ -j <jobs> --jobs=<jobs>    Number of parallel requests [default: 4]
+ --warm                     Measure a second run against a warm cache
+ --cache-dir=<dir>          Where the warm cache is kept
+ --port=<port>              Port to serve on [default: 8765]
+ --identity                 Serve uncompressed responses even when gzip is accepted
+ --items=<items>            Number of shows in the models benchmark [default: 10000]
+
+"""
+from __future__ import with_statement
+import BaseHTTPServer
+import json
+import os
+import random
+import resource
+import shutil
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import zlib
+
+from docopt import docopt
+
+from TraktTv import HttpTransport, LibraryMirror, ResponseCache, SeasonState, Show, TraktTvAPI, TraktTvController, iter_json_array
+
+
+def deep_size(obj, seen=None):
+    """Approximate memory held by obj, counting every shared object once"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_size(i, seen) for i in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_size(getattr(obj, a), seen) for a in obj.__slots__)
+    return size
+
+
+def timed(func, repeat=3):
+    """Best wall time of func over repeat runs, in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        func()
+        elapsed = timeit.default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+##
+# EPISODE STATE
+##
+def synthetic_progress(shows, seed):
+    """user/progress/watched shaped records: a few seasons per show, partially watched"""
+    rnd = random.Random(seed)
+    progress = []
+    for show_id in range(1, shows + 1):
+        seasons = []
+        for season in range(1, rnd.randint(1, 10) + 1):
+            count = rnd.randint(6, 26)
+            watched = rnd.randint(0, count)
+            seasons.append({'season': season, 'episodes': dict((str(e), e <= watched) for e in range(1, count + 1))})
+        progress.append({'show': {'tvdb_id': show_id}, 'seasons': seasons})
+    return progress
+
+
+def build_dicts(progress):
+    episodes = {}
+    for show in progress:
+        seasons = episodes.setdefault(int(show['show']['tvdb_id']), {})
+        for s in show['seasons']:
+            season = seasons.setdefault(int(s['season']), {})
+            for e, seen in s['episodes'].items():
+                season[int(e)] = seen
+    return episodes
+
+
+def build_bits(progress):
+    episodes = {}
+    for show in progress:
+        seasons = episodes.setdefault(int(show['show']['tvdb_id']), {})
+        for s in show['seasons']:
+            seasons.setdefault(int(s['season']), SeasonState()).update(s['episodes'])
+    return episodes
+
+
+def bench_episodes(shows, seed):
+    progress = synthetic_progress(shows, seed)
+    dicts, bits = build_dicts(progress), build_bits(progress)
+
+    def dict_unwatched():
+        return sum(1 for seasons in dicts.values() for season in seasons.values() for seen in season.values() if not seen)
+
+    def bits_unwatched():
+        return sum(season.unwatched_count() for seasons in bits.values() for season in seasons.values())
+
+    def dict_next():
+        return [min([e for e, seen in season.items() if not seen] or [None]) for seasons in dicts.values() for season in seasons.values()]
+
+    def bits_next():
+        return [season.next_unwatched() for seasons in bits.values() for season in seasons.values()]
+
+    def dict_iterate():
+        for seasons in dicts.values():
+            for season in seasons.values():
+                for e, seen in sorted(season.items()):
+                    pass
+
+    def bits_iterate():
+        for seasons in bits.values():
+            for season in seasons.values():
+                for e, seen in season:
+                    pass
+
+    assert dict_unwatched() == bits_unwatched()
+    assert dict_next() == bits_next()
+
+    episodes = sum(len(season) for seasons in bits.values() for season in seasons.values())
+    print "%d shows, %d episodes" % (shows, episodes)
+    print "%-22s %12s %12s" % ('', 'dict', 'SeasonState')
+    print "%-22s %12d %12d" % ('memory (bytes)', deep_size(dicts), deep_size(bits))
+    for label, a, b in (
+        ('build (ms)', lambda: build_dicts(progress), lambda: build_bits(progress)),
+        ('unwatched count (ms)', dict_unwatched, bits_unwatched),
+        ('next unwatched (ms)', dict_next, bits_next),
+        ('iterate (ms)', dict_iterate, bits_iterate),
+    ):
+        print "%-22s %12.2f %12.2f" % (label, timed(a), timed(b))
+
+
+##
+# MODELS
+##
+def write_synthetic_watchlist(f, items, seed):
+    """Writes user/watchlist/shows shaped JSON, with the fields the API sends that the views don't use, one show at a time"""
+    rnd = random.Random(seed)
+    f.write('[')
+    for i in range(1, items + 1):
+        f.write((', ' if i > 1 else '') + json.dumps({
+            'title': u'Show %d' % i, 'year': 1990 + i % 30, 'tvdb_id': i, 'tmdb_id': 10 ** 5 + i, 'imdb_id': 'tt%07d' % i,
+            'url': 'http://trakt.tv/show/show-%d' % i, 'first_aired': 631152000 + i * 86400, 'country': 'United States',
+            'overview': ' '.join('word%d' % rnd.randint(0, 999) for _ in range(40)), 'runtime': 42, 'network': 'Network %d' % (i % 20),
+            'genres': ['drama', 'comedy'][:rnd.randint(1, 2)],
+            'images': {'poster': 'http://trakt.tv/images/%d.jpg' % i, 'fanart': 'http://trakt.tv/images/%d-fanart.jpg' % i},
+            'ratings': {'percentage': rnd.randint(0, 100), 'votes': rnd.randint(0, 10000), 'loved': 1, 'hated': 1},
+        }))
+    f.write(']')
+
+
+def copy_dicts(text):
+    """What TraktTvAPI.my_shows used to do: decode the whole list, then copy every show into a new dict"""
+    return [{'title': s['title'], 'year': s['year'], 'tvdb_id': s.get('tvdb_id', ''), 'tmdb_id': s.get('tmdb_id', ''),
+             'imdb_id': s.get('imdb_id', ''), 'id': s['tvdb_id']} for s in json.loads(text)]
+
+
+def build_models(text):
+    return [Show(s) for s in iter_json_array([text])]
+
+
+BUILDERS = {'dicts': copy_dicts, 'models': build_models}
+
+
+def run_models_child(path, builder):
+    """Builds one watchlist from the JSON file and prints the peak RSS before and after as JSON"""
+    with open(path) as f:
+        text = f.read()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result = BUILDERS[builder](text)
+    print json.dumps({'text': before, 'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+
+
+def bench_models(items, seed):
+    # Peaks are measured in a fresh process per builder, reading the JSON from a file. A child
+    # starts from its parent's RSS, so they run before this process holds the text or builds anything
+    handle, path = tempfile.mkstemp(prefix='trakttvpy-bench-', suffix='.json')
+    try:
+        with os.fdopen(handle, 'w') as f:
+            write_synthetic_watchlist(f, items, seed)
+        peaks = [json.loads(subprocess.check_output([sys.executable, os.path.abspath(__file__), 'models-child', path, builder]))
+                 for builder in ('dicts', 'models')]
+        with open(path) as f:
+            text = f.read()
+    finally:
+        os.unlink(path)
+
+    dicts, models = copy_dicts(text), build_models(text)
+    assert [d['title'] for d in dicts] == [m.title for m in models]
+
+    def footprint(obj):
+        seen = set()
+        return deep_size(obj, seen), len(seen)
+
+    print "%d shows, %d bytes of JSON" % (items, len(text))
+    print "%-22s %12s %12s" % ('', 'dict copies', 'Show')
+    (dict_bytes, dict_objects), (model_bytes, model_objects) = footprint(dicts), footprint(models)
+    print "%-22s %12d %12d" % ('retained (bytes)', dict_bytes, model_bytes)
+    print "%-22s %12d %12d" % ('retained objects', dict_objects, model_objects)
+    # ru_maxrss is in kilobytes, the first row includes the interpreter and the JSON text
+    print "%-22s %12.1f %12.1f" % ('peak RSS (MB)', peaks[0]['maxrss'] / 1024.0, peaks[1]['maxrss'] / 1024.0)
+    print "%-22s %12.1f %12.1f" % ('peak over text (MB)', (peaks[0]['maxrss'] - peaks[0]['text']) / 1024.0, (peaks[1]['maxrss'] - peaks[1]['text']) / 1024.0)
+    print "%-22s %12.2f %12.2f" % ('build (ms)', timed(lambda: copy_dicts(text)), timed(lambda: build_models(text)))
+
+
+##
+# FAKE API
+##
+class SyntheticLibrary(object):
+    """Deterministic responses for the endpoints the controller uses"""
+
+    def __init__(self, shows, movies, seed):
+        self.seed = seed
+        self.shows = [{'title': u'Show %d' % i, 'year': 1990 + i % 30, 'tvdb_id': i, 'imdb_id': 'tt%07d' % i} for i in range(1, shows + 1)]
+        self.movies = [{'title': u'Movie %d' % i, 'year': 1970 + i % 50, 'tmdb_id': i, 'imdb_id': 'tt%07d' % (10 ** 6 + i)} for i in range(1, movies + 1)]
+
+    def _seasons(self, show_id):
+        rnd = random.Random(self.seed * 100003 + int(show_id))
+        return [(season, rnd.randint(6, 26)) for season in range(1, rnd.randint(1, 10) + 1)]
+
+    def _progress(self, show_id):
+        rnd = random.Random(self.seed * 7919 + int(show_id))
+        seasons, left = [], 0
+        for season, count in self._seasons(show_id):
+            watched = rnd.randint(0, count)
+            left += count - watched
+            seasons.append({'season': season, 'episodes': dict((str(e), e <= watched) for e in range(1, count + 1))})
+        return {'show': {'tvdb_id': int(show_id), 'title': u'Show %s' % show_id}, 'progress': {'left': left}, 'seasons': seasons}
+
+    def _ids(self, args, position):
+        return [i for i in (args[position] if len(args) > position else '').split(',') if i.isdigit()]
+
+    def get(self, endpoint, args):
+        if endpoint == 'user/watchlist/shows':
+            return self.shows
+        if endpoint == 'user/watchlist/movies':
+            return self.movies
+        if endpoint == 'user/library/movies/watched':
+            return self.movies[::3]
+        if endpoint == 'user/library/shows/all':
+            return self.shows
+        if endpoint == 'user/library/movies/all':
+            return self.movies
+        if endpoint == 'user/progress/watched':
+            # Only shows with an even id have been started
+            return [self._progress(i) for i in self._ids(args, 1) if int(i) % 2 == 0]
+        if endpoint == 'show/seasons':
+            return [{'season': season, 'episodes': count} for season, count in reversed(self._seasons(args[0]))]
+        if endpoint == 'show/summaries':
+            return [dict(self.shows[int(i) - 1], seasons=[{'season': season, 'episodes': count} for season, count in self._seasons(i)])
+                    for i in self._ids(args, 0) if int(i) <= len(self.shows)]
+        if endpoint == 'search/shows':
+            return self.shows[:10]
+        if endpoint == 'search/movies':
+            return self.movies[:10]
+        if endpoint == 'user/lastactivity':
+            return {'all': 1, 'movie': {'watched': 1, 'watchlist': 1}, 'episode': {'watched': 1, 'watchlist': 1}, 'show': {'watchlist': 1}}
+        return []
+
+    def post(self, endpoint, data):
+        return {'status': 'success', 'message': endpoint}
+
+
+class FakeTraktServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Local HTTP stand-in for api.trakt.tv. Responses come from recorded
+    fixtures when present, from the SyntheticLibrary otherwise.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, library, latency=0, fixtures=None, port=0, gzip=True):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), FakeTraktHandler)
+        self.library  = library
+        self.latency  = latency
+        self.fixtures = fixtures
+        self.gzip     = gzip
+        self.lock     = threading.Lock()
+        self.reset()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def reset(self):
+        with self.lock:
+            self.requests, self.bytes_in, self.bytes_out = 0, 0, 0
+
+    def count(self, bytes_in, bytes_out):
+        with self.lock:
+            self.requests  += 1
+            self.bytes_in  += bytes_in
+            self.bytes_out += bytes_out
+
+    def fixture(self, endpoint):
+        path = os.path.join(self.fixtures or '', endpoint.replace('/', '_') + '.json')
+        if self.fixtures and os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+class FakeTraktHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers are written one by one, Nagle plus delayed ACKs would add 40ms per response
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, result, bytes_in):
+        body = json.dumps(result)
+        gzip = self.server.gzip and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzip:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(bytes_in + len(self.path), len(body))
+
+    def do_GET(self):
+        endpoint, _, rest = self.path.strip('/').partition('.json')
+        args = rest.strip('/').split('/')[1:]
+        result = self.server.fixture(endpoint)
+        self._respond(self.server.library.get(endpoint, args) if result is None else result, 0)
+
+    def do_POST(self):
+        endpoint = self.path.strip('/').rsplit('/', 1)[0]
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        result = self.server.fixture(endpoint)
+        self._respond(self.server.library.post(endpoint, json.loads(body or 'null')) if result is None else result, len(body))
+
+
+##
+# SCENARIOS
+##
+SCENARIOS = (
+    ('search',         ['search', 'show'],           []),
+    ('watchlist',      ['watchlist'],                []),
+    ('details',        ['watchlist', '--details'],   []),
+    ('moviewatchlist', ['moviewatchlist'],           []),
+    ('watch',          ['watchlist', '--watch'],     ['1x1x1-12 2x1 3 4x2x3']),
+)
+
+
+class ScriptedController(TraktTvController):
+    """Answers the interactive prompts from a list"""
+
+    def __init__(self, argv, api, answers):
+        self.answers = list(answers)
+        TraktTvController.__init__(self, argv, api)
+
+    def _prompt(self, text):
+        return self.answers.pop(0)
+
+
+def run_child(url, name, arguments):
+    """Runs one scenario in this process and prints its wall time and peak memory as JSON"""
+    argv, answers = dict((s[0], s[1:]) for s in SCENARIOS)[name]
+    jobs = int(arguments['--jobs'])
+    cache_dir = arguments['--cache-dir']
+
+    def scenario():
+        cache = mirror = None
+        if cache_dir:
+            cache, mirror = ResponseCache(os.path.join(cache_dir, 'cache')), LibraryMirror(os.path.join(cache_dir, 'cache'))
+        api = TraktTvAPI('benchmark', 'benchmark', 'benchmark', HttpTransport(pool_size=jobs), api_url=url, cache=cache, mirror=mirror)
+        ScriptedController(argv + ['--jobs', str(jobs)], api, answers)
+
+    # Keep the controller output out of the report
+    report = os.fdopen(os.dup(1), 'w')
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+
+    start = timeit.default_timer()
+    scenario()
+    wall = timeit.default_timer() - start
+    report.write(json.dumps({'wall': wall, 'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+    report.close()
+
+
+def run(arguments):
+    names = arguments['<scenario>'] or [s[0] for s in SCENARIOS]
+    unknown = set(names) - set(s[0] for s in SCENARIOS)
+    if unknown:
+        sys.exit("Unknown scenario: %s" % ", ".join(sorted(unknown)))
+
+    library = SyntheticLibrary(int(arguments['--shows']), int(arguments['--movies']), int(arguments['--seed']))
+    server = FakeTraktServer(library, float(arguments['--latency']) / 1000, arguments['--fixtures'], gzip=not arguments['--identity']).start()
+    options = ['--jobs', arguments['--jobs'], '--shows', arguments['--shows'], '--movies', arguments['--movies'], '--seed', arguments['--seed']]
+
+    print "%-16s %10s %10s %12s %12s %12s" % ('scenario', 'wall (s)', 'requests', 'bytes sent', 'bytes recv', 'peak RSS (MB)')
+    for name in names:
+        cache_dir = tempfile.mkdtemp(prefix='trakttvpy-bench-') if arguments['--warm'] else None
+        try:
+            child = [sys.executable, os.path.abspath(__file__), 'child', server.url, name] + options
+            if cache_dir:
+                child += ['--cache-dir', cache_dir]
+                subprocess.check_output(child)
+            server.reset()
+            result = json.loads(subprocess.check_output(child))
+        finally:
+            if cache_dir:
+                shutil.rmtree(cache_dir)
+        print "%-16s %10.3f %10d %12d %12d %12.1f" % (name, result['wall'], server.requests, server.bytes_in, server.bytes_out, result['maxrss'] / 1024.0)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    if arguments['episodes']:
+        bench_episodes(int(arguments['--shows']), int(arguments['--seed']))
+    elif arguments['models']:
+        bench_models(int(arguments['--items']), int(arguments['--seed']))
+    elif arguments['run']:
+        run(arguments)
+    elif arguments['models-child']:
+        run_models_child(arguments['<json>'], arguments['<builder>'])
+    elif arguments['child']:
+        run_child(arguments['<url>'], arguments['<scenario>'][0], arguments)
+    elif arguments['serve']:
+        library = SyntheticLibrary(int(arguments['--shows']), int(arguments['--movies']), int(arguments['--seed']))
+        server = FakeTraktServer(library, float(arguments['--latency']) / 1000, arguments['--fixtures'], int(arguments['--port']), not arguments['--identity'])
+        print "Serving a fake api.trakt.tv on %s" % server.url
+        server.serve_forever()
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+import httplib
+import json
+import random
+import threading
+import unittest
+import urllib2
+
+from TraktTv import AsyncTraktTvAPI, EpisodePlanner, HttpTransport, LibraryMirror, MutationBatcher, iter_json_array
+
+
+class FakeAPI(object):
+    """Answers get_show_seasons from a {show id: {season: episodes}} dict"""
+
+    def __init__(self, seasons):
+        self.seasons = seasons
+
+    def get_show_seasons(self, show_id):
+        return [{'season': season, 'episodes': count} for season, count in self.seasons.get(show_id, {}).items()]
+
+
+class IterJsonArrayTest(unittest.TestCase):
+
+    DOCUMENTS = [
+        '[12345, -1.5e10, 7, -15000000000.25, 1E+3, 0.5e-2]',
+        '[{"title": "Show, 1", "ids": [1, 2]}, "a]b", true, null, false, 3]',
+        ' \n[ ]',
+        '{"status": "failure", "error": "bad key"}',
+        '42',
+    ]
+
+    def split(self, text, rnd):
+        cuts = sorted(rnd.sample(range(1, len(text)), rnd.randint(0, min(6, len(text) - 1))))
+        return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+    def expected(self, text):
+        document = json.loads(text)
+        return document if isinstance(document, list) else [document]
+
+    def test_every_split(self):
+        for text in self.DOCUMENTS:
+            for i in range(1, len(text)):
+                self.assertEqual(list(iter_json_array([text[:i], text[i:]])), self.expected(text), (text[:i], text[i:]))
+
+    def test_random_splits(self):
+        rnd = random.Random(1)
+        for text in self.DOCUMENTS:
+            for _ in range(200):
+                chunks = self.split(text, rnd)
+                self.assertEqual(list(iter_json_array(chunks)), self.expected(text), chunks)
+
+    def test_one_chunk_per_character(self):
+        for text in self.DOCUMENTS:
+            self.assertEqual(list(iter_json_array(list(text))), self.expected(text))
+
+    def test_truncated(self):
+        self.assertRaises(ValueError, list, iter_json_array(['[1, 2, {"a"', ': 1']))
+
+
+class EpisodePlannerParseTest(unittest.TestCase):
+
+    def test_shows(self):
+        self.assertEqual(EpisodePlanner.parse('2'), [(2, None, None)])
+        self.assertEqual(EpisodePlanner.parse('1-3'), [(1, None, None), (2, None, None), (3, None, None)])
+
+    def test_seasons(self):
+        self.assertEqual(EpisodePlanner.parse('2x3'), [(2, (3, 1), (3, None))])
+        self.assertEqual(EpisodePlanner.parse('2x1-3'), [(2, (1, 1), (3, None))])
+
+    def test_episodes(self):
+        self.assertEqual(EpisodePlanner.parse('2x3x10'), [(2, (3, 10), (3, 10))])
+        self.assertEqual(EpisodePlanner.parse('2x3x1-10'), [(2, (3, 1), (3, 10))])
+
+    def test_cross_season_range(self):
+        self.assertEqual(EpisodePlanner.parse('2x1x5-3x24'), [(2, (1, 5), (3, 24))])
+        # Used to read as seasons 1 to 3, the x24 being ignored
+        self.assertEqual(EpisodePlanner.parse('2x1-3x24'), [(2, (1, 1), (3, 24))])
+
+    def test_invalid(self):
+        for command in ('2x1x5-3', '2x3x10-2', '2x1x2x3', 'ax1', '2x3-1', '2x1x5-1x3', '2x', '2-', '2x1-', '2x1x-3'):
+            self.assertRaises(ValueError, EpisodePlanner.parse, command)
+
+
+class EpisodePlannerPlanTest(unittest.TestCase):
+
+    def plan(self, command, watch=True, seasons=None):
+        api = FakeAPI({10: seasons if seasons is not None else {1: 3, 2: 2}})
+        planner = EpisodePlanner(api)
+        batch = planner.plan(planner.parse(command), {1: 10}, MutationBatcher(api, watch))
+        return [(method, kwargs) for labels, method, kwargs in batch.calls() if method != 'post_show_watchlist'], planner
+
+    def episodes(self, calls):
+        return [(e['season'], e['episode']) for method, kwargs in calls for e in kwargs.get('episodes', [])]
+
+    def test_whole_seasons_collapse(self):
+        calls, _ = self.plan('1x1-2')
+        self.assertEqual([method for method, kwargs in calls], ['post_show_seen'])
+        calls, _ = self.plan('1x1x2-2x2')
+        self.assertEqual([method for method, kwargs in calls], ['post_show_season_seen', 'post_show_episode_seen'])
+        self.assertEqual(self.episodes(calls), [(1, 2), (1, 3)])
+
+    def test_unwatch_expands_seasons(self):
+        calls, _ = self.plan('1x2', watch=False)
+        self.assertEqual(self.episodes(calls), [(2, 1), (2, 2)])
+
+    def test_episodes_past_known_counts_are_kept(self):
+        calls, _ = self.plan('1x2x2-4')
+        self.assertEqual(self.episodes(calls), [(2, 2), (2, 3), (2, 4)])
+        calls, _ = self.plan('1x2x1-4', watch=False)
+        self.assertEqual(self.episodes(calls), [(2, 1), (2, 2), (2, 3), (2, 4)])
+
+    def test_unknown_season(self):
+        calls, _ = self.plan('1x5')
+        self.assertEqual(calls, [('post_show_season_seen', {'tvdb_id': 10, 'season': 5})])
+        calls, planner = self.plan('1x5', watch=False)
+        self.assertEqual(calls, [])
+        self.assertEqual(planner.skipped, [(1, 5)])
+
+    def test_unknown_short_id(self):
+        _, planner = self.plan('7x1')
+        self.assertEqual(planner.unknown, [7])
+
+
+class AsyncTraktTvAPICallbackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api = AsyncTraktTvAPI('apikey', 'user', 'password', workers=2)
+        self.calls = []
+        self.done = threading.Event()
+
+    def tearDown(self):
+        self.api.close()
+
+    def callback(self, value, error):
+        self.calls.append((value, error))
+        self.done.set()
+
+    def test_value(self):
+        result = self.api.submit(lambda a, b=0: a + b, 1, b=2, callback=self.callback)
+        self.assertTrue(self.done.wait(5))
+        self.assertEqual(self.calls, [(3, None)])
+        self.assertEqual(result.get(5), 3)
+
+    def test_error(self):
+        def fail():
+            raise ValueError('boom')
+        result = self.api.submit(fail, callback=self.callback)
+        self.assertTrue(self.done.wait(5))
+        self.assertEqual(self.calls[0][0], None)
+        self.assertTrue(isinstance(self.calls[0][1], ValueError))
+        self.assertRaises(ValueError, result.get, 5)
+
+
+class FakeResponse(object):
+    status     = 200
+    will_close = False
+
+    def read(self, size=None):
+        return '{}'
+
+    def getheaders(self):
+        return []
+
+
+class FakeConnection(object):
+    """Records what was sent, a stale one fails like a dropped keep-alive connection"""
+
+    def __init__(self, stale=False):
+        self.stale = stale
+        self.sent  = []
+
+    def request(self, method, path, body, headers):
+        self.sent.append(method)
+
+    def getresponse(self):
+        if self.stale:
+            raise httplib.BadStatusLine('')
+        return FakeResponse()
+
+    def close(self):
+        pass
+
+
+class HttpTransportReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fresh = []
+        self.fresh_stale = False
+        self.transport = HttpTransport()
+        self.transport._connect = self.connect
+        self.stale = FakeConnection(stale=True)
+        self.transport._pool('http', 'api.trakt.tv').put_nowait(self.stale)
+
+    def connect(self, scheme, netloc):
+        self.fresh.append(FakeConnection(self.fresh_stale))
+        return self.fresh[-1]
+
+    def test_get_is_replayed(self):
+        self.assertEqual(self.transport.request('http://api.trakt.tv/a')[0], 200)
+        self.assertEqual((self.stale.sent, len(self.fresh)), (['GET'], 1))
+
+    def test_idempotent_post_is_replayed(self):
+        self.transport.request('http://api.trakt.tv/a', '{}', idempotent=True)
+        self.assertEqual((self.stale.sent, len(self.fresh)), (['POST'], 1))
+
+    def test_post_gets_a_fresh_connection(self):
+        self.transport.request('http://api.trakt.tv/a', '{}')
+        self.assertEqual((self.stale.sent, [c.sent for c in self.fresh]), ([], [['POST']]))
+
+    def test_post_is_sent_once(self):
+        self.fresh_stale = True
+        self.assertRaises(urllib2.URLError, self.transport.request, 'http://api.trakt.tv/a', '{}')
+        self.assertEqual([c.sent for c in self.fresh], [['POST']])
+
+
+class LibraryMirrorTest(unittest.TestCase):
+
+    def keys(self, mirror):
+        return sorted(key for key, in mirror._db.execute('SELECT key FROM library'))
+
+    def age(self, mirror, seconds):
+        mirror._db.execute('UPDATE library SET fetched = fetched - ?', (seconds,))
+
+    def test_expired_entries_are_dropped(self):
+        mirror = LibraryMirror(':memory:', max_age=100)
+        mirror.set('a', '[1]', 'a data')
+        self.age(mirror, 200)
+        self.assertEqual(mirror.get('a'), None)
+        self.assertEqual(self.keys(mirror), [])
+
+    def test_expired_entries_are_evicted_on_set(self):
+        mirror = LibraryMirror(':memory:', max_age=100)
+        mirror.set('a', '[1]', 'a data')
+        mirror.set('b', '[1]', 'b data')
+        self.age(mirror, 200)
+        mirror.set('c', '[1]', 'c data')
+        self.assertEqual(self.keys(mirror), ['c'])
+
+    def test_oldest_entries_are_evicted_past_max_size(self):
+        rnd = random.Random(1)
+        data = ''.join(chr(rnd.randint(0, 255)) for _ in range(1000))
+        mirror = LibraryMirror(':memory:', max_size=2500)
+        for key in 'abc':
+            mirror.set(key, '[1]', data + key)
+            self.age(mirror, 10)
+        mirror.set('d', '[1]', data + 'd')
+        self.assertEqual(self.keys(mirror), ['c', 'd'])
+        self.assertEqual(mirror.get('d')[2], data + 'd')
+
+
+if __name__ == '__main__':
+    unittest.main()